@@ -0,0 +1,114 @@
+import re
+from fractions import Fraction
+
+_NUMBER = re.compile(r"\d+(?:\.\d*)?|\.\d+")
+_INTEGER = re.compile(r"\d+")
+
+
+def _parse_power(text, pos):
+    # Optional "^n", "**n", "^-n" or "^(-n)" after an x; returns (exponent, position after it)
+    if text.startswith("**", pos):
+        pos += 2
+    elif text.startswith("^", pos):
+        pos += 1
+    else:
+        return 1, pos
+    parenthesized = text.startswith("(", pos)
+    if parenthesized:
+        pos += 1
+    sign = 1
+    if pos < len(text) and text[pos] in "+-":
+        sign = -1 if text[pos] == "-" else 1
+        pos += 1
+    match = _INTEGER.match(text, pos)
+    if match is None:
+        raise ValueError(f"expected an integer exponent at {pos}")
+    pos = match.end()
+    if parenthesized:
+        if not text.startswith(")", pos):
+            raise ValueError(f"expected ')' at {pos}")
+        pos += 1
+    return sign * int(match.group()), pos
+
+
+def parse_laurent(text):
+    # Parses a sum of terms like 24x^3, -x, 6/x^2, 6x^-2, 3*x**(-1) or 7 into an exponent -> coefficient
+    # map with zero terms left out. Raises ValueError for anything else (brackets, products, other
+    # symbols...), which the caller hands to sympy.
+    text = "".join(text.split())
+    if not text:
+        raise ValueError("empty expression")
+    terms = {}
+    pos = 0
+    while pos < len(text):
+        sign = 1
+        if text[pos] in "+-":
+            sign = -1 if text[pos] == "-" else 1
+            pos += 1
+        elif pos > 0:
+            raise ValueError(f"expected '+' or '-' at {pos}")
+        match = _NUMBER.match(text, pos)
+        if match:
+            number = match.group()
+            coefficient = Fraction(number) if "." in number else int(number)
+            pos = match.end()
+            if text.startswith("*", pos) and not text.startswith("**", pos):
+                pos += 1
+                if not text.startswith("x", pos):
+                    raise ValueError(f"expected 'x' at {pos}")
+        else:
+            coefficient = 1
+        if text.startswith("x", pos):
+            exponent, pos = _parse_power(text, pos + 1)
+        elif match and text.startswith("/x", pos):
+            exponent, pos = _parse_power(text, pos + 2)
+            exponent = -exponent
+        elif match:
+            exponent = 0
+        else:
+            raise ValueError(f"expected a number or 'x' at {pos}")
+        terms[exponent] = terms.get(exponent, 0) + sign * coefficient
+    return {exponent: coefficient for exponent, coefficient in terms.items() if coefficient != 0}
+
+
+def check_with_sympy(answer, derivative):
+    # The general path: rewrite the answer into sympy syntax and simplify the difference.
+    # Raises sp.SympifyError (a ValueError) for input sympy can't read.
+    import sympy as sp
+
+    user_derivative = answer.replace('^', '**')
+    user_derivative = ''.join(
+        f'{char}*' if char.isdigit() and next_char.isalpha() else char
+        for char, next_char in zip(user_derivative, user_derivative[1:] + ' ')
+    )
+    user_derivative = re.sub(r'(\d+)(x)\^-(\d+)', r'\1/(\2**\3)', user_derivative)
+    user_derivative = sp.sympify(user_derivative)
+    return sp.simplify(user_derivative - derivative) == 0
+
+
+def check_derivative(answer, derivative_coefficients, derivative):
+    # Compares exponent -> coefficient maps exactly when the answer is a plain Laurent polynomial,
+    # otherwise falls back to sympy. Returns (correct, checked_with) where checked_with is "parser" or "sympy".
+    try:
+        return parse_laurent(answer) == derivative_coefficients, "parser"
+    except ValueError:
+        return check_with_sympy(answer, derivative), "sympy"
+
+
+def format_answer(coefficients, negative_exponents="slash"):
+    # Writes a derivative the way a user would type it: "24x^3 - 24x^2 + 6/x^2" or with "6x^-2"
+    terms = []
+    for exponent, coefficient in sorted(coefficients.items(), reverse=True):
+        sign = "-" if coefficient < 0 else "+"
+        magnitude = abs(coefficient)
+        if exponent == 0:
+            term = f"{magnitude}"
+        elif exponent < 0 and negative_exponents == "slash":
+            term = f"{magnitude}/x" if exponent == -1 else f"{magnitude}/x^{-exponent}"
+        else:
+            term = f"{'' if magnitude == 1 else magnitude}x" + ("" if exponent == 1 else f"^{exponent}")
+        terms.append((sign, term))
+    if not terms:
+        return "0"
+    first_sign, first_term = terms[0]
+    return ("-" if first_sign == "-" else "") + first_term + "".join(f" {sign} {term}" for sign, term in terms[1:])
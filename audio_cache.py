@@ -0,0 +1,65 @@
+import hashlib
+import mmap
+import os
+
+PCM_SUFFIX = ".pcm"
+
+
+class AudioCache:
+    # Decoded tracks stored as raw PCM in the mixer's sample format, one file per track, so a
+    # track is decoded once and afterwards loaded by memory-mapping the file. Files are touched
+    # on every use and the least recently used ones are deleted once the folder exceeds max_bytes.
+    # The mixer must be initialised before use; its format is part of each file's key.
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        from pygame import mixer
+
+        self.mixer = mixer
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path(self, path):
+        stat = os.stat(path)
+        key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.mixer.get_init()}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + PCM_SUFFIX)
+
+    def decode(self, path, keep=()):
+        # Returns the PCM file for path, decoding it first if it isn't cached yet. Tracks in keep
+        # (source paths) are about to be played and are never evicted to make room.
+        pcm_path = self.cache_path(path)
+        if os.path.exists(pcm_path):
+            os.utime(pcm_path)
+            return pcm_path
+        raw = self.mixer.Sound(path).get_raw()
+        temp_path = pcm_path + ".tmp"
+        with open(temp_path, "wb") as pcm_file:
+            pcm_file.write(raw)
+        os.replace(temp_path, pcm_path)
+        self.evict(keep={pcm_path, *(self.cache_path(song) for song in keep)})
+        return pcm_path
+
+    def load(self, path, keep=()):
+        # Decodes if needed, then builds a Sound straight from the mapped PCM file
+        pcm_path = self.decode(path, keep)
+        with open(pcm_path, "rb") as pcm_file:
+            if os.fstat(pcm_file.fileno()).st_size == 0:
+                return self.mixer.Sound(buffer=b"")
+            with mmap.mmap(pcm_file.fileno(), 0, access=mmap.ACCESS_READ) as pcm:
+                return self.mixer.Sound(buffer=pcm)
+
+    def evict(self, keep=()):
+        # Delete least recently used files until the cache fits in max_bytes; PCM files in keep are spared
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(PCM_SUFFIX)]
+        stats = sorted(((entry.stat(), entry.path) for entry in entries), key=lambda item: item[0].st_mtime_ns)
+        total = sum(stat.st_size for stat, _ in stats)
+        for stat, pcm_path in stats:
+            if total <= self.max_bytes:
+                break
+            if pcm_path in keep:
+                continue
+            try:
+                os.remove(pcm_path)
+            except OSError:
+                continue
+            total -= stat.st_size
+        return total
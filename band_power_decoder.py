@@ -0,0 +1,25 @@
+import json
+
+import numpy as np
+
+NUM_BANDS = 5
+
+
+def decode_packet(data):
+    # Returns (packet_type, payload): a (channels x 5) float array for bandPower packets, the decoded
+    # dict for any other packet type. Raises ValueError for data that isn't an OpenBCI packet.
+    # OpenBCI GUI sends {"type":"bandPower","data":[[delta,theta,alpha,beta,gamma], ...one row per channel]}
+    try:
+        data_dict = json.loads(data)
+        packet_type = data_dict["type"]
+    except (TypeError, KeyError) as e:
+        raise ValueError(f"not an OpenBCI packet: {e}") from e
+    if packet_type != "bandPower":
+        return packet_type, data_dict
+    try:
+        bands = np.asarray(data_dict.get("data"), dtype=np.float64)
+    except TypeError as e:
+        raise ValueError(f"bad bandPower data: {e}") from e
+    if bands.ndim != 2 or bands.shape[1] != NUM_BANDS:
+        raise ValueError(f"expected (channels x {NUM_BANDS}) band powers, got shape {bands.shape}")
+    return packet_type, bands
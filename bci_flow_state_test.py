@@ -1,85 +1,395 @@
+import sys
+from startup import StartupProfiler, start_warmup
+# Installed before anything else is imported so --profile-startup sees every import
+STARTUP_PROFILER = StartupProfiler.from_argv(sys.argv)
 import tkinter as tk
 import os
 import random
-from pygame import mixer
 import socket
 import json
 import threading
 from datetime import datetime
-import matplotlib.pyplot as plt
-import re
-import sympy as sp
 import signal
+import selectors
+import time
+import concurrent.futures
+import numpy as np
+from sample_store import SampleStore
+from log_writer import DetailedLogWriter
+from session_format import SESSION_FILE_SUFFIX
+from ingest_pipeline import PacketQueue, StageLatency
+from band_power_decoder import decode_packet
+from interval_stats import IntervalStats
+from flow_score import FlowScoreEngine
+from graph_renderer import GraphRenderer
+from live_plot import LivePlot
+from music_library import MusicLibrary
+from audio_cache import AudioCache
+from problem_pool import ProblemPool
+from answer_checker import check_derivative
+from genre_bandit import GenreBandit, DecisionLog, decide
+from deadline_scheduler import DeadlineScheduler
 
 TIMER_DURATION_SECONDS = 15 # change to appropriate value during testing e.g. 300
 BREAK_DURATION_SECONDS = 5 # change to appropriate value during testing e.g. 120
 MAX_CYCLES = 4
+PROBLEM_DIFFICULTY = "normal" # "easy", "normal" or "hard": exponent and coefficient ranges (see problem_pool.py)
+PROBLEM_POOL_SIZE = 20 # derivative problems kept ready by a background worker
 MUSIC_FOLDER = "music"
+AUDIO_CACHE_FOLDER = "audio_cache" # decoded PCM copies of tracks, prepared during breaks
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3 # least recently used tracks are deleted beyond this size
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER_SAMPLES = 512 # mixer output buffer, about 12 ms at 44.1 kHz
+MUSIC_POLL_MS = 50 # how often the player checks for track changes and refills the mixer queue
+MUSIC_FADE_OUT_MS = 0 # fade the music out over this long before the interval deadline; 0 cuts it exactly at the deadline
+ADAPTIVE_GENRES = False # choose and switch genres with a Thompson-sampling bandit on the live flow score instead of one random genre per interval
+ADAPTIVE_DECISION_SECONDS = 30 # how long a genre plays before the bandit decides again
+ADAPTIVE_SEED = None # bandit random seed; None picks one. Either way it is written to the decision log for replay
+MUSIC_LIBRARY_INDEX = "music_library.json" # cached track list and durations, refreshed at startup when files change
+DETAILED_LOG_QUEUE_SIZE = 10000 # records buffered for the detailed log writer before new ones are dropped
+DETAILED_LOG_FLUSH_INTERVAL_MS = 1000 # flush the detailed log at least this often...
+DETAILED_LOG_FLUSH_EVERY_RECORDS = 500 # ...or after this many records, and always at interval end
+UDP_IP = "127.0.0.1"
+UDP_PORT = 12345
+UDP_MAX_DATAGRAM_BYTES = 65535 # largest possible UDP payload, so bandPower packets are never truncated
+UDP_RCVBUF_BYTES = 4 * 1024 * 1024 # kernel receive buffer requested for the socket, absorbs bursts from OpenBCI GUI
+UDP_RECV_BATCH_SIZE = 256 # datagrams drained per selector wakeup
+PIPELINE_QUEUE_SIZE = 8192 # packets buffered between the receive and processing stages
+PIPELINE_OVERFLOW_POLICY = "drop_oldest" # when that buffer is full: "block", "drop_oldest" or "drop_newest"
+PIPELINE_BATCH_SIZE = 64 # packets decoded and processed per micro-batch
+PIPELINE_DRAIN_TIMEOUT_SECONDS = 5 # upper bound on how long interval end waits for the interval's queued packets to be processed
+NO_DATA_WARNING_SECONDS = 5 # warn if nothing arrives on the socket for this long during an interval
+FINALIZE_WORKERS = 2 # background workers writing summaries and graphs at interval end
+FINALIZE_POLL_MS = 100 # how often the UI checks for finished interval results
+GRAPH_WORKERS = 2 # processes rendering graphs (see graph_renderer.py for downsampling settings)
+LIVE_PLOT = True # show the scrolling theta/alpha panel during the test (see live_plot.py for window and refresh rate)
+FLOW_EMA_SECONDS = 2 # time constant of the flow score's exponential moving average
+FLOW_MEDIAN_WINDOW_SECONDS = 5 # the flow score is the median theta/alpha ratio over this window, as a z-score against interval 1
+LOG_FOLDER = "logs" # detailed logs, session files, summaries, graphs and genre decisions
+WRITE_SESSION_FILE = True # also write a compact binary copy of the detailed log (see session_format.py)
+
+# Linux reports kernel-side datagram drops through this socket option; the constant isn't exported by Python
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+# recvmsg_into (and with it the drop counter and truncation flag) doesn't exist on Windows
+HAS_RECVMSG = hasattr(socket.socket, "recvmsg_into")
+
+class RecordingInterval:
+    # Everything recorded for one test interval. Once finished it is never written to again,
+    # so finalization can read it from another thread while the next interval records.
+    # Its times are on the sample clock (monotonic_ns()); wall_start_ns is the wall-clock time read
+    # together with start_ns, the one anchor every wall-clock time in its logs is derived from.
+    # log_stamp is the start time every file of the interval is named after.
+    def __init__(self, start_ns, wall_start_ns, duration_seconds, log_stamp, detailed_log_writer, packet_counts_start, queue_dropped_start):
+        self.start_ns = start_ns
+        self.wall_start_ns = wall_start_ns
+        self.log_stamp = log_stamp
+        self.end_ns = None
+        # A fixed-length interval's planned end; packets stamped at or after it are left out even if
+        # end_interval() runs late
+        self.deadline_ns = None
+        self.finished = False
+        self.samples = SampleStore()
+        self.stats = IntervalStats(start_ns, duration_seconds)
+        self.stats_index = 0
+        self.detailed_log_writer = detailed_log_writer
+        self.packet_counts_start = packet_counts_start
+        self.packet_counts = None
+        self.queue_dropped_start = queue_dropped_start
+        self.queue_dropped = 0
+
+    def wall_ns(self, timestamp_ns):
+        return self.wall_start_ns + (timestamp_ns - self.start_ns)
+
+    def accepts(self, arrival_ns):
+        # Packets belong to the interval their arrival time falls in, however long they sat in the queue
+        return (not self.finished and arrival_ns >= self.start_ns
+                and (self.end_ns is None or arrival_ns < self.end_ns)
+                and (self.deadline_ns is None or arrival_ns < self.deadline_ns))
+
+    def update_stats(self):
+        # Fold the samples recorded since the last call into the running interval statistics
+        end = self.samples.num_samples
+        if end > self.stats_index:
+            self.samples.update_features()
+            self.stats.add_rows(self.samples, self.stats_index, end)
+            self.stats_index = end
 
 class UDPListener(threading.Thread):
-    def __init__(self, flow_state_test_app):
-        super().__init__()
+    def __init__(self, flow_state_test_app, address=(UDP_IP, UDP_PORT), clock=time):
+        super().__init__(daemon=True)
+        self.address = address
+        # Samples and interval boundaries are stamped on the sample clock, clock.monotonic_ns(), so a
+        # wall-clock step can't change an interval's length; packets received on the socket are always
+        # stamped with the real time.monotonic_ns()
+        self.clock = clock
+        self.bound = threading.Event()
         self.stop_event = threading.Event()
-        self.band_powers = []
-        self.num_channels = 0
-        self.theta_alpha_ratios = []
-        self.per_channel_theta_alpha_ratios = []
-        self.timestamps = []
-        self.theta_values = []
-        self.alpha_values = []
-        self.detailed_log_file = None
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.interval_lock = threading.Lock()
+        self.interval = None
+        self.open_intervals = []
+        self.receive_buffer = bytearray(UDP_MAX_DATAGRAM_BYTES)
+        self.ancillary_size = socket.CMSG_SPACE(4) if HAS_RECVMSG and SO_RXQ_OVFL is not None else 0
+        self.packet_counts = {"received": 0, "malformed": 0, "truncated": 0, "non_band_power": 0, "dropped": 0}
+        self.packet_queue = PacketQueue(PIPELINE_QUEUE_SIZE, PIPELINE_OVERFLOW_POLICY)
+        self.receive_latency = StageLatency()
+        self.queue_latency = StageLatency()
+        self.processing_latency = StageLatency()
+        self.empty_samples = SampleStore()
+        self.flow_score = FlowScoreEngine(FLOW_EMA_SECONDS, FLOW_MEDIAN_WINDOW_SECONDS)
         self.flow_state_test_app = flow_state_test_app
 
+    @property
+    def recording(self):
+        return self.interval is not None and self.interval.end_ns is None
+
+    @property
+    def samples(self):
+        return self.interval.samples if self.interval else self.empty_samples
+
+    @property
+    def current_flow_score(self):
+        # Latest FlowScore (or None before the first sample of an interval); a plain attribute read,
+        # safe from any thread
+        return self.flow_score.current
+
+    @property
+    def detailed_log_writer(self):
+        return self.interval.detailed_log_writer if self.interval else None
+
+    # Read-only views over the latest interval's sample store, kept under their original names
+    @property
+    def num_channels(self):
+        return self.samples.num_channels
+
+    @property
+    def band_powers(self):
+        return self.samples.averages
+
+    @property
+    def theta_values(self):
+        return self.samples.theta
+
+    @property
+    def alpha_values(self):
+        return self.samples.alpha
+
+    @property
+    def theta_alpha_ratios(self):
+        return self.samples.ratios
+
+    @property
+    def per_channel_theta_alpha_ratios(self):
+        return self.samples.per_channel_ratios
+
+    @property
+    def timestamps(self):
+        return self.samples.timestamps
+
     def run(self):
         self.start_udp_listener()
 
     def start_udp_listener(self):
-        UDP_IP = "127.0.0.1"
-        UDP_PORT = 12345
-
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.settimeout(5)  # Set a timeout value (in seconds)
-            sock.bind((UDP_IP, UDP_PORT))
+        # One socket for the whole session; intervals are marked by begin_interval()/end_interval()
+        # rather than by re-binding, and stop() wakes the selector immediately through a socket pair.
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF_BYTES)
+            if SO_RXQ_OVFL is not None:
+                # Ask the kernel to attach its dropped-datagram counter to every packet
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            sock.bind(self.address)
+        except OSError as e:
+            print(f"ERROR: Could not bind UDP socket {self.address[0]}:{self.address[1]}: {e}")
+            return
+        sock.setblocking(False)
+        rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if rcvbuf < UDP_RCVBUF_BYTES:
+            print(f"WARNING: UDP receive buffer is {rcvbuf} bytes, less than the requested {UDP_RCVBUF_BYTES} (check net.core.rmem_max)")
 
-            log_dir = "logs"
-            os.makedirs(log_dir, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            detailed_log_file_path = os.path.join(log_dir, f"{timestamp}_detailed_log.txt")
-            self.detailed_log_file = open(detailed_log_file_path, "w")
+        processing_thread = threading.Thread(target=self.process_packets, daemon=True)
+        processing_thread.start()
+        self.bound.set()
 
+        with sock, selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            selector.register(self.wakeup_receiver, selectors.EVENT_READ)
             while not self.stop_event.is_set():
-                try:
-                    data, _ = sock.recvfrom(1024)
-                    data_dict = json.loads(data.decode())
-    
-                    if data_dict["type"] == "bandPower":
-                        self.process_band_power_data(data_dict)
-                except socket.timeout:
-                    print("ERROR: No data received on UDP socket, recheck connection.")
+                events = selector.select(timeout=NO_DATA_WARNING_SECONDS)
+                if not events:
+                    if self.recording:
+                        print("ERROR: No data received on UDP socket, recheck connection.")
+                    continue
+                for key, _ in events:
+                    if key.fileobj is self.wakeup_receiver:
+                        self.wakeup_receiver.recv(64)
+                    else:
+                        self.receive_batch(sock)
 
-            if self.detailed_log_file:
-                self.detailed_log_file.close()
+        self.end_interval()
+        for interval in list(self.open_intervals):
+            self.finish_interval(interval, wait=False)
+        self.packet_queue.close()
+        processing_thread.join()
+        self.wakeup_receiver.close()
+        self.wakeup_sender.close()
 
-    def process_band_power_data(self, data_dict):
-        band_power_data = data_dict["data"]
-        self.num_channels = len(band_power_data)
+    def receive_batch(self, sock):
+        # Receive stage: drain up to UDP_RECV_BATCH_SIZE queued datagrams per wakeup, copy the bytes,
+        # stamp the arrival time and hand them to the processing stage. No decoding happens here.
+        buffer = self.receive_buffer
+        counts = self.packet_counts
+        for _ in range(UDP_RECV_BATCH_SIZE):
+            try:
+                if HAS_RECVMSG:
+                    nbytes, ancdata, flags, _ = sock.recvmsg_into([buffer], self.ancillary_size)
+                else:
+                    nbytes, _ = sock.recvfrom_into(buffer)
+                    ancdata, flags = (), 0
+            except (BlockingIOError, InterruptedError):
+                return
+            arrival_ns = time.monotonic_ns()
+            counts["received"] += 1
+            for level, cmsg_type, cmsg_data in ancdata:
+                if SO_RXQ_OVFL is not None and level == socket.SOL_SOCKET and cmsg_type == SO_RXQ_OVFL and len(cmsg_data) >= 4:
+                    # Cumulative count of datagrams the kernel dropped because the buffer was full
+                    kernel_dropped = int.from_bytes(cmsg_data[:4], sys.byteorder)
+                    if kernel_dropped > counts["dropped"]:
+                        print(f"WARNING: {kernel_dropped - counts['dropped']} UDP packets dropped by the kernel (receive buffer full)")
+                        counts["dropped"] = kernel_dropped
+            if flags & socket.MSG_TRUNC:
+                counts["truncated"] += 1
+                continue
+            # The arrival time is also the sample's time; replays queue the recorded time instead
+            self.packet_queue.put((bytes(buffer[:nbytes]), arrival_ns, arrival_ns))
+            self.receive_latency.add(time.monotonic_ns() - arrival_ns)
 
-        channel_averages = [sum(row[i] for row in band_power_data) / self.num_channels for i in range(5)]
-        avg_theta = channel_averages[1]
-        avg_alpha = channel_averages[2]
+    def process_packets(self):
+        # Processing stage: decode and compute in micro-batches, taking the interval lock once per batch
+        counts = self.packet_counts
+        while True:
+            batch = self.packet_queue.get_batch(PIPELINE_BATCH_SIZE, timeout=0.5)
+            if not batch:
+                if self.packet_queue.closed:
+                    return
+                continue
+            dequeued_ns = time.monotonic_ns()
+            with self.interval_lock:
+                for data, arrival_ns, sample_ns in batch:
+                    self.queue_latency.add(dequeued_ns - arrival_ns)
+                    start_ns = time.perf_counter_ns()
+                    try:
+                        packet_type, payload = decode_packet(data)
+                    except ValueError:
+                        counts["malformed"] += 1
+                        continue
 
-        self.timestamps.append(datetime.now())
-        self.theta_values.append(avg_theta)
-        self.alpha_values.append(avg_alpha)
-        self.band_powers.append(channel_averages)
+                    if packet_type == "bandPower":
+                        for interval in self.open_intervals:
+                            if interval.accepts(sample_ns):
+                                self.process_band_power_data(payload, sample_ns, interval)
+                                break
+                    else:
+                        counts["non_band_power"] += 1
+                    self.processing_latency.add(time.perf_counter_ns() - start_ns)
+                for interval in self.open_intervals:
+                    interval.update_stats()
+            self.packet_queue.task_done()
 
-        theta_alpha_ratio = avg_theta / avg_alpha if avg_alpha != 0 else float('inf')
-        per_channel_theta_alpha_ratio = [row[1] / row[2] for row in band_power_data]
-        
-        self.theta_alpha_ratios.append(theta_alpha_ratio)
-        self.per_channel_theta_alpha_ratios.append(per_channel_theta_alpha_ratio)
+    def begin_interval(self, duration_seconds=TIMER_DURATION_SECONDS, log_dir=LOG_FOLDER, fixed_length=False):
+        os.makedirs(log_dir, exist_ok=True)
+        timestamp = datetime.fromtimestamp(self.clock.time_ns() / 1e9).strftime("%Y%m%d%H%M%S")
+        detailed_log_file_path = os.path.join(log_dir, f"{timestamp}_detailed_log.txt")
+        detailed_log_writer = DetailedLogWriter(
+            detailed_log_file_path,
+            queue_size=DETAILED_LOG_QUEUE_SIZE,
+            flush_interval_ms=DETAILED_LOG_FLUSH_INTERVAL_MS,
+            flush_every_records=DETAILED_LOG_FLUSH_EVERY_RECORDS,
+            session_path=os.path.join(log_dir, f"{timestamp}{SESSION_FILE_SUFFIX}") if WRITE_SESSION_FILE else None,
+        )
+        detailed_log_writer.start()
+        with self.interval_lock:
+            start_ns = self.clock.monotonic_ns()
+            self.interval = RecordingInterval(start_ns, self.clock.time_ns(), duration_seconds, timestamp, detailed_log_writer,
+                                              dict(self.packet_counts), self.packet_queue.dropped)
+            if fixed_length:
+                self.interval.deadline_ns = start_ns + int(duration_seconds * 1e9)
+            self.open_intervals.append(self.interval)
+            self.receive_latency = StageLatency()
+            self.queue_latency = StageLatency()
+            self.processing_latency = StageLatency()
+            self.flow_score.reset()
+        self.log_marker("interval_start", start_ns, planned_seconds=duration_seconds)
+        return self.interval
+
+    def end_interval(self, end_ns=None):
+        # Only marks the end; packets that arrived before the marker may still be in the queue,
+        # so the interval stays open until finish_interval() drains them. A replay passes end_ns, the
+        # sample time its recording ended at; how late the marker came is only logged for live ends.
+        with self.interval_lock:
+            interval = self.interval
+            if interval is None or interval.end_ns is not None:
+                return None
+            now_ns = self.clock.monotonic_ns()
+            if end_ns is not None:
+                interval.end_ns = end_ns
+            else:
+                interval.end_ns = now_ns if interval.deadline_ns is None else min(now_ns, interval.deadline_ns)
+        fields = {"recorded_seconds": (interval.end_ns - interval.start_ns) / 1e9}
+        if end_ns is None:
+            fields["marked_late_ms"] = (now_ns - interval.end_ns) / 1e6
+        self.log_marker("interval_end", interval.end_ns, **fields)
+        return interval
+
+    def finish_interval(self, interval, wait=True):
+        # Drains the pipeline, freezes the interval and closes its logs. With wait=True this blocks
+        # until queued packets are processed and the logs are on disk, so run it off the UI thread.
+        # Only packets stamped before the interval's end belong to it; the next interval's keep flowing
+        end_ns = interval.end_ns if interval.end_ns is not None else self.clock.monotonic_ns()
+        if wait and not self.packet_queue.drain(PIPELINE_DRAIN_TIMEOUT_SECONDS, end_ns):
+            print(f"WARNING: {self.packet_queue.pending_before(end_ns)} packets of the interval still queued "
+                  f"after {PIPELINE_DRAIN_TIMEOUT_SECONDS} s were not recorded")
+        with self.interval_lock:
+            interval.finished = True
+            interval.update_stats()
+            if interval in self.open_intervals:
+                self.open_intervals.remove(interval)
+            interval.packet_counts = {name: count - interval.packet_counts_start.get(name, 0) for name, count in self.packet_counts.items()}
+            interval.queue_dropped = self.packet_queue.dropped - interval.queue_dropped_start
+        counts = interval.packet_counts
+        print(f"UDP packets: {counts['received']} received, {counts['malformed']} malformed, {counts['truncated']} truncated, "
+              f"{counts['non_band_power']} not bandPower, {counts['dropped']} dropped, "
+              f"{interval.queue_dropped} dropped by the pipeline queue")
+        print(f"Pipeline latency: receive {self.receive_latency.describe()}; queue {self.queue_latency.describe()}; "
+              f"processing {self.processing_latency.describe()}")
+        writer_stats = interval.detailed_log_writer.stats()
+        print(f"Detailed log writer: {writer_stats['queue_depth']} records queued at interval end, "
+              f"{writer_stats['dropped_records']} dropped (queue full), {writer_stats['flushes']} flushes")
+        interval.detailed_log_writer.close(wait=wait)
+        return interval
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+    def process_band_power_data(self, band_power_data, timestamp_ns=None, interval=None):
+        if timestamp_ns is None:
+            timestamp_ns = self.clock.monotonic_ns()
+        if interval is None:
+            interval = self.interval
+        samples = interval.samples
+        try:
+            i = samples.append(band_power_data, timestamp_ns)
+        except ValueError:
+            self.packet_counts["malformed"] += 1
+            return
+
+        channel_averages = samples.channel_averages[i].tolist()
+        avg_theta = channel_averages[1]
+        avg_alpha = channel_averages[2]
+        theta_alpha_ratio = float(samples.theta_alpha_ratios[i])
+        per_channel_theta_alpha_ratio = samples.per_channel_theta_alpha_ratios[i].tolist()
+        # Late packets of an interval that has already ended don't move the live flow score
+        flow_score = self.flow_score.add(timestamp_ns, theta_alpha_ratio) if interval is self.interval else None
+
+        wall_ns = interval.wall_ns(timestamp_ns)
+        timestamp = datetime.fromtimestamp(wall_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f")
         log_entry = {
             "timestamp": timestamp,
             "test_interval": self.flow_state_test_app.current_cycle,
@@ -88,70 +398,488 @@ class UDPListener(threading.Thread):
             "num_correct": self.flow_state_test_app.correct_answers,
             "band_power_data": band_power_data,
             "channel_averages": channel_averages,
-            "num_channels": self.num_channels,
+            "num_channels": samples.num_channels,
             "avg_theta": avg_theta,
             "avg_alpha": avg_alpha,
             "theta_alpha_ratio": theta_alpha_ratio,
-            "per_channel_theta_alpha_ratio": per_channel_theta_alpha_ratio
+            "per_channel_theta_alpha_ratio": per_channel_theta_alpha_ratio,
+            "channel_valid": samples.channel_valid[i].tolist(),
+            "flow_score": None if flow_score is None or np.isnan(flow_score.score) else flow_score.score
         }
-        self.detailed_log_file.write(json.dumps(log_entry) + "\n")
-        self.detailed_log_file.flush()
+        interval.detailed_log_writer.write(log_entry, wall_ns)
+
+    def wall_time_ns(self, timestamp_ns):
+        # A sample-clock time as wall-clock time for the logs, through the current interval's anchor
+        if self.interval is None:
+            return self.clock.time_ns() - (self.clock.monotonic_ns() - timestamp_ns)
+        return self.interval.wall_ns(timestamp_ns)
+
+    def log_marker(self, event, timestamp_ns, **fields):
+        # Interval boundaries on the sample clock, so a log shows exactly which window was recorded
+        wall_ns = self.wall_time_ns(timestamp_ns)
+        self.log_event({
+            "timestamp": datetime.fromtimestamp(wall_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "event": event,
+            "test_interval": self.flow_state_test_app.current_cycle,
+            "sample_clock_ns": timestamp_ns,
+            **fields,
+        }, wall_ns)
+
+    def log_event(self, record, timestamp_ns=None):
+        # Records other than samples (e.g. track start/stop) go to the current interval's detailed log
+        interval = self.interval
+        if interval is None or interval.finished:
+            return
+        interval.detailed_log_writer.write(record, timestamp_ns)
 
     def stop(self):
         self.stop_event.set()
+        try:
+            self.wakeup_sender.send(b"\0")
+        except OSError:
+            pass
 
 class MusicPlayer:
-    def __init__(self, flow_state_test_app):
+    def __init__(self, flow_state_test_app, audio=True):
         self.flow_state_test_app = flow_state_test_app
+        self.clock = flow_state_test_app.clock
+        # Without audio the player still picks genres and tracks and logs them, but a track only
+        # "plays" for its indexed duration on the app's clock; pygame is never loaded
+        self.audio = audio
+        self.track_end_id = None
         self.current_genre = None
         self.current_song = None
         self.used_genres = []
         self.played_songs = []
+        self.played_genres = []
+        self.track_start_latencies_ms = []
+        self.next_genre = None
+        self.next_songs = []
+        self.next_sound = None
+        self.mixer = None
+        self.audio_cache = None
+        self.loader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
+        # Playback state: the channel plays the current track and holds the next one in its queue,
+        # so the mixer switches tracks on its own without a gap
+        self.channel = None
+        self.playlist = []
+        self.playlist_index = 0
+        self.playing = None
+        self.queued = None
+        self.deadline = None
+        self.poll_id = None
+        self.deadline_id = None
+        # Adaptive mode: the bandit, its decision log, a shuffled playlist per genre, the decision
+        # period being scored, and a switch waiting for its first track to load
+        self.bandit = None
+        self.decision_log = None
+        self.genre_playlists = {}
+        self.epoch = None
+        self.pending_switch = None
+        # Genres, tracks and durations come from the on-disk index, so starting a song never decodes audio.
+        # The music folder is rescanned on the loader thread so the window doesn't wait for it; the
+        # first break is the earliest the library is read.
+        self.library = MusicLibrary(MUSIC_FOLDER, MUSIC_LIBRARY_INDEX).load()
+        self.library_refresh = self.loader.submit(self.refresh_library, self.library.tracks)
+        flow_state_test_app.root.after(MUSIC_POLL_MS, self.check_library_refresh)
+
+    def refresh_library(self, tracks):
+        library = MusicLibrary(MUSIC_FOLDER, MUSIC_LIBRARY_INDEX)
+        library.tracks = tracks
+        return library, library.refresh()
+
+    def check_library_refresh(self):
+        if self.library_refresh is None:
+            return
+        if self.library_refresh.done():
+            self.apply_library_refresh()
+        else:
+            self.flow_state_test_app.root.after(MUSIC_POLL_MS, self.check_library_refresh)
+
+    def apply_library_refresh(self):
+        future, self.library_refresh = self.library_refresh, None
+        try:
+            library, changed = future.result()
+        except OSError as e:
+            print(f"WARNING: Could not scan the music folder {MUSIC_FOLDER}: {e}")
+            return
+        self.library = library
+        if changed:
+            print(f"Music library: {changed} tracks added, updated or removed ({len(library.tracks)} total)")
+
+    def prepare(self, next_cycle):
+        # Runs at the start of a break: pick the next interval's genre and song order now, and decode
+        # and load its first track in the background so on_continue only has to start playback
+        if self.library_refresh is not None:
+            # Interval 1 was too short for the rescan; the genres have to wait for it
+            self.apply_library_refresh()
+        if self.audio:
+            if self.mixer is None:
+                # pygame is first needed here, in the break before interval 2
+                from pygame import mixer
+                self.mixer = mixer
+            if not self.mixer.get_init():
+                self.mixer.init(frequency=MIXER_FREQUENCY, channels=2, buffer=MIXER_BUFFER_SAMPLES)
+            if self.audio_cache is None:
+                self.audio_cache = AudioCache(AUDIO_CACHE_FOLDER, AUDIO_CACHE_MAX_BYTES)
+        if ADAPTIVE_GENRES:
+            self.prepare_adaptive(next_cycle)
+            return
+        available_genres = [genre for genre in self.library.genres() if genre not in self.used_genres]
+        if not available_genres:
+            self.next_genre = None
+            return
+        self.next_genre = random.choice(available_genres)
+        songs = self.library.songs(self.next_genre)
+        random.shuffle(songs)
+        # Decode as many tracks as the interval can play, but only hold the first one in memory
+        upcoming = []
+        total_duration = 0
+        for song, duration in songs:
+            if total_duration >= TIMER_DURATION_SECONDS:
+                break
+            upcoming.append(song)
+            total_duration += duration
+        self.next_songs = songs
+        if self.audio:
+            self.preload(songs[0][0], upcoming)
+            for song in upcoming[1:]:
+                self.loader.submit(self.audio_cache.decode, song, upcoming)
+        print(f"Test {next_cycle}: preparing {self.next_genre}")
+
+    def prepare_adaptive(self, next_cycle):
+        # Every genre may be switched to during the interval, so each gets a fresh track order and
+        # its first track decoded now; a switch then only has to map that track from the cache
+        genres = self.library.genres()
+        if not genres:
+            self.next_genre = None
+            return
+        if self.bandit is None:
+            self.bandit = GenreBandit(genres, ADAPTIVE_SEED)
+            log_dir = self.flow_state_test_app.log_dir
+            os.makedirs(log_dir, exist_ok=True)
+            timestamp = datetime.fromtimestamp(self.clock.time_ns() / 1e9).strftime("%Y%m%d%H%M%S")
+            self.decision_log = DecisionLog(os.path.join(log_dir, f"{timestamp}_genre_decisions.jsonl"), self.bandit)
+        self.genre_playlists = {}
+        for genre in self.bandit.genres:
+            songs = self.library.songs(genre)
+            if songs:
+                random.shuffle(songs)
+                self.genre_playlists[genre] = songs
+        first_songs = [songs[0][0] for songs in self.genre_playlists.values()]
+        record = self.log_decision(decide(self.bandit), next_cycle, "interval_start")
+        self.next_genre = record["choice"]
+        self.next_songs = self.genre_playlists[self.next_genre]
+        if self.audio:
+            self.preload(self.next_songs[0][0], first_songs)
+            for song in first_songs:
+                self.loader.submit(self.audio_cache.decode, song, first_songs)
+        print(f"Test {next_cycle}: preparing {self.next_genre} (adaptive)")
+
+    def log_decision(self, record, cycle, reason):
+        record = {**record, "test_interval": cycle, "reason": reason}
+        self.decision_log.write(record, self.clock.time_ns())
+        return record
+
+    def start_epoch(self):
+        # Flow scores are credited to the genre once its music fills the median window
+        self.epoch = {
+            "genre": self.current_genre,
+            "deadline": self.clock.monotonic() + ADAPTIVE_DECISION_SECONDS,
+            "settled_ns": self.clock.monotonic_ns() + int(FLOW_MEDIAN_WINDOW_SECONDS * 1e9),
+            "total": 0.0,
+            "count": 0,
+            "last_ns": None,
+        }
+
+    def end_epoch(self):
+        # The period's reward as (genre, average flow score), or None if no settled score arrived
+        epoch, self.epoch = self.epoch, None
+        if epoch is None or epoch["count"] == 0:
+            return None
+        return epoch["genre"], epoch["total"] / epoch["count"]
+
+    def update_epoch(self):
+        # Polled with check_playback: accumulate the listener's latest flow score, and decide once the period is over
+        epoch = self.epoch
+        flow_score = self.flow_state_test_app.udp_listener.current_flow_score
+        if (flow_score is not None and flow_score.timestamp_ns != epoch["last_ns"]
+                and flow_score.timestamp_ns >= epoch["settled_ns"] and np.isfinite(flow_score.score)):
+            epoch["last_ns"] = flow_score.timestamp_ns
+            epoch["total"] += flow_score.score
+            epoch["count"] += 1
+        if self.clock.monotonic() >= epoch["deadline"]:
+            self.decide_genre()
+
+    def decide_genre(self):
+        requested_ns = time.perf_counter_ns()
+        reward = self.end_epoch()
+        record = self.log_decision(decide(self.bandit, reward), self.flow_state_test_app.current_cycle, "period_end")
+        genre = record["choice"]
+        if genre == self.current_genre or genre not in self.genre_playlists:
+            self.start_epoch()
+            return
+        self.pending_switch = (genre, requested_ns)
+        if self.audio:
+            # Keep the current track playing until the new genre's first track is loaded
+            self.preload(self.genre_playlists[genre][0][0])
+        else:
+            self.switch_genre()
+
+    def switch_genre(self):
+        genre, requested_ns = self.pending_switch
+        self.pending_switch = None
+        if self.audio:
+            self.sync_queued_track()
+            # Channel.stop also drops the queued track of the old genre
+            self.channel.stop()
+        elif self.track_end_id is not None:
+            self.flow_state_test_app.root.after_cancel(self.track_end_id)
+            self.track_end_id = None
+        self.track_stopped(self.clock.monotonic_ns(), "switch")
+        self.queued = None
+        self.current_genre = genre
+        self.played_genres.append(genre)
+        self.playlist = self.genre_playlists[genre]
+        self.playlist_index = 0
+        latency_ms = self.start_track(requested_ns)
+        self.decision_log.write({"event": "switch", "test_interval": self.flow_state_test_app.current_cycle, "genre": genre,
+                                 "latency_ms": None if latency_ms is None else round(latency_ms, 3)},
+                                self.clock.time_ns())
+        self.start_epoch()
 
-    def play_music(self, current_cycle):
-        available_genres = [genre for genre in os.listdir(MUSIC_FOLDER) if genre not in self.used_genres]
-        if available_genres:
-            self.current_genre = random.choice(available_genres)
+    def preload(self, song, keep=()):
+        self.next_sound = (song, self.loader.submit(self.audio_cache.load, song, keep))
+
+    def load_sound(self, song):
+        # The preloaded Sound if it is for this song, otherwise load it now (slow path, includes any decoding)
+        if self.next_sound is not None and self.next_sound[0] == song:
+            future = self.next_sound[1]
+            self.next_sound = None
+            preloaded = future.done()
+            return future.result(), preloaded
+        return self.audio_cache.load(song), False
+
+    def play_music(self, current_cycle, requested_ns=None, deadline_ns=None):
+        # deadline_ns is the clock's monotonic_ns() at which the interval ends; the music is cut (or faded
+        # out) exactly then, and the playlist repeats if it runs out before it
+        if self.next_genre is None or (not ADAPTIVE_GENRES and self.next_genre in self.used_genres):
+            self.prepare(current_cycle)
+        if self.next_genre is not None:
+            self.current_genre = self.next_genre
+            self.next_genre = None
             self.used_genres.append(self.current_genre)
             print(f"Test {current_cycle}: {self.current_genre}")
-            mixer.init()
-            genre_folder = os.path.join(MUSIC_FOLDER, self.current_genre)
-            songs = [os.path.join(genre_folder, song) for song in os.listdir(genre_folder)]
-            random.shuffle(songs)
             self.played_songs = []
-            self.play_song(songs)
+            self.played_genres = [self.current_genre]
+            self.track_start_latencies_ms = []
+            self.playlist = self.next_songs
+            self.playlist_index = 0
+            self.deadline = deadline_ns
+            if deadline_ns is not None:
+                self.deadline_id = self.flow_state_test_app.scheduler.call_at(deadline_ns, self.stop, "deadline")
+            self.start_track(requested_ns)
+            if ADAPTIVE_GENRES:
+                self.start_epoch()
+            self.poll_id = self.flow_state_test_app.root.after(MUSIC_POLL_MS, self.check_playback)
         else:
             print(f"Test {current_cycle}: All Genres Have Been Played")
 
-    def play_song(self, songs):
-        if songs and self.flow_state_test_app.timer_running:
-            song = songs.pop(0)
-            self.current_song = os.path.splitext(os.path.basename(song))[0]
-            print(self.current_song)
-            mixer.music.load(song)
-            mixer.music.play()
-            self.played_songs.append(self.current_song)
-            song_duration = mixer.Sound(song).get_length()
-            remaining_time = self.flow_state_test_app.get_remaining_time()
-            if remaining_time > song_duration:
-                self.flow_state_test_app.root.after(int(song_duration * 1000), self.play_song, songs)
+    def next_song(self):
+        song = self.playlist[self.playlist_index % len(self.playlist)]
+        self.playlist_index += 1
+        return song
+
+    def start_track(self, requested_ns=None):
+        # Starts the next playlist track right away, used for the first track and whenever the queue ran dry.
+        # Returns the start latency in ms, or None without audio or if no track could be started.
+        latency_ms = None
+        if requested_ns is None:
+            requested_ns = time.perf_counter_ns()
+        if not self.audio:
+            song, duration = self.next_song()
+            sound = None
+            start_ns = self.clock.monotonic_ns()
+            self.track_end_id = self.flow_state_test_app.root.after(max(1, int(duration * 1000)), self.silent_track_ended)
+        else:
+            for _ in range(len(self.playlist)):
+                song, _ = self.next_song()
+                try:
+                    sound, preloaded = self.load_sound(song)
+                    break
+                except Exception as e:
+                    print(f"ERROR: Could not load {song}: {e!r}")
+            else:
+                return None
+            self.channel = sound.play()
+            start_ns = self.clock.monotonic_ns()
+            if self.channel is None:
+                print(f"ERROR: No mixer channel free to play {song}")
+                return None
+            self.channel.set_volume(1.0)
+            # Only real playback has a start latency worth keeping; without audio it would just be
+            # real time spent in this call, which would make headless summaries differ between runs
+            latency_ms = (time.perf_counter_ns() - requested_ns) / 1e6
+            self.track_start_latencies_ms.append(latency_ms)
+            print(f"Track start latency: {latency_ms:.2f} ms ({'preloaded' if preloaded else 'loaded on demand'})")
+        self.track_started(song, sound, start_ns)
+        return latency_ms
+
+    def silent_track_ended(self):
+        self.track_end_id = None
+        self.track_stopped(self.clock.monotonic_ns(), "ended")
+        self.start_track()
+
+    def track_started(self, song, sound, start_ns):
+        self.playing = (song, sound, start_ns)
+        self.current_song = os.path.splitext(os.path.basename(song))[0]
+        self.played_songs.append(self.current_song)
+        print(self.current_song)
+        self.log_track("track_start", start_ns)
+        if self.audio:
+            self.preload(self.playlist[self.playlist_index % len(self.playlist)][0])
+
+    def track_stopped(self, stop_ns, reason):
+        song, sound, start_ns = self.playing
+        self.log_track("track_stop", stop_ns, reason=reason, played_seconds=round((stop_ns - start_ns) / 1e9, 6))
+        self.playing = None
+
+    def log_track(self, event, timestamp_ns, **fields):
+        # Track times are on the sample clock, like the listener's samples
+        udp_listener = self.flow_state_test_app.udp_listener
+        wall_ns = udp_listener.wall_time_ns(timestamp_ns)
+        record = {
+            "timestamp": datetime.fromtimestamp(wall_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "event": event,
+            "test_interval": self.flow_state_test_app.current_cycle,
+            "current_genre": self.current_genre,
+            "current_song": self.current_song,
+            **fields,
+        }
+        udp_listener.log_event(record, wall_ns)
+
+    def sync_queued_track(self):
+        # True if the mixer has started the queued track since the last check. It started the moment
+        # the previous track ended, so its start time comes from the previous track's length
+        # rather than from when this check ran.
+        if self.queued is None or self.channel.get_queue() is not None or not self.channel.get_busy():
+            return False
+        song, sound, start_ns = self.playing
+        end_ns = start_ns + int(sound.get_length() * 1e9)
+        self.track_stopped(end_ns, "ended")
+        self.track_started(*self.queued, end_ns)
+        self.queued = None
+        return True
+
+    def check_playback(self):
+        # Polled from the Tk loop: notices when the mixer has moved on to the queued track, refills the
+        # queue once the next track is loaded, and ramps the volume down before the deadline
+        self.poll_id = None
+        if self.playing is None:
+            return
+        if not self.audio:
+            if self.epoch is not None:
+                self.update_epoch()
+            self.poll_id = self.flow_state_test_app.root.after(MUSIC_POLL_MS, self.check_playback)
+            return
+        if not self.sync_queued_track() and not self.channel.get_busy():
+            print("WARNING: Next track wasn't loaded in time, playback had a gap")
+            song, sound, start_ns = self.playing
+            self.track_stopped(start_ns + int(sound.get_length() * 1e9), "ended")
+            self.queued = None
+            self.start_track()
+        if self.pending_switch is not None:
+            if self.next_sound[1].done():
+                self.switch_genre()
+        elif self.epoch is not None:
+            self.update_epoch()
+        if self.pending_switch is None and self.queued is None and self.next_sound is not None and self.next_sound[1].done() and self.playing:
+            song = self.next_sound[0]
+            try:
+                sound, _ = self.load_sound(song)
+            except Exception as e:
+                print(f"ERROR: Could not load {song}: {e!r}")
+                self.next_song()
+                self.preload(self.playlist[self.playlist_index % len(self.playlist)][0])
+            else:
+                self.next_song()
+                self.channel.queue(sound)
+                self.queued = (song, sound)
+        if self.deadline is not None and MUSIC_FADE_OUT_MS > 0:
+            remaining_ms = (self.deadline - self.clock.monotonic_ns()) / 1e6
+            if remaining_ms < MUSIC_FADE_OUT_MS:
+                self.channel.set_volume(max(0.0, remaining_ms / MUSIC_FADE_OUT_MS))
+        self.poll_id = self.flow_state_test_app.root.after(MUSIC_POLL_MS, self.check_playback)
+
+    def stop(self, reason="stopped"):
+        root = self.flow_state_test_app.root
+        for after_id in (self.poll_id, self.track_end_id):
+            if after_id is not None:
+                root.after_cancel(after_id)
+        if self.deadline_id is not None:
+            self.flow_state_test_app.scheduler.cancel(self.deadline_id)
+        self.poll_id = self.deadline_id = self.track_end_id = None
+        self.deadline = None
+        self.pending_switch = None
+        if self.epoch is not None:
+            # The interval's last decision period still counts, even though no decision follows it yet
+            reward = self.end_epoch()
+            if reward is not None:
+                self.bandit.update(*reward)
+                self.decision_log.write({"event": "reward", "test_interval": self.flow_state_test_app.current_cycle,
+                                         "genre": reward[0], "value": reward[1]}, self.clock.time_ns())
+        if self.playing is not None and self.audio:
+            self.sync_queued_track()
+        if self.mixer and self.mixer.get_init():
+            # Channel.stop also clears the queued track, so nothing starts after the cut
+            self.mixer.stop()
+        if self.playing is not None:
+            self.track_stopped(self.clock.monotonic_ns(), reason)
+        self.queued = None
+
+    def close(self):
+        self.loader.shutdown(wait=True, cancel_futures=True)
+        if self.decision_log:
+            self.decision_log.close()
+        if self.mixer:
+            self.mixer.quit()
 
 
 class FlowStateTestApp:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None, clock=time, audio=True, log_dir=LOG_FOLDER):
+        # clock provides time_ns(), monotonic() and monotonic_ns() for the protocol's timing and log names; the
+        # headless engine (headless.py) passes a virtual one together with a simulated root
         self.root = root
+        self.clock = clock
+        self.log_dir = log_dir
+        # Countdowns, breaks and the music cut-off run at absolute deadlines on clock.monotonic_ns()
+        self.scheduler = DeadlineScheduler(root, clock)
         self.current_cycle = 1
-        self.udp_listener = UDPListener(self)
+        self.udp_listener = UDPListener(self, clock=clock)
         self.timer_running = False
         self.remaining_time = 0
-        self.music_player = MusicPlayer(self)
+        self.music_player = MusicPlayer(self, audio)
+        self.finalizer = concurrent.futures.ThreadPoolExecutor(max_workers=FINALIZE_WORKERS, thread_name_prefix="finalize")
+        self.pending_finalizations = []
+        self.graph_renderer = GraphRenderer(max_workers=GRAPH_WORKERS)
+        self.problem_pool = ProblemPool(PROBLEM_DIFFICULTY, PROBLEM_POOL_SIZE)
+        self.profiler = profiler
+        self.warmup = None
     
         self.root.title("Musical Flow State Test")
-        self.root.geometry("400x300")
+        self.root.geometry("600x560" if LIVE_PLOT else "400x300")
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.bind("<Map>", self.on_map, add="+")
+        self.live_plot = None
+        self.create_widgets()
+
+    def create_widgets(self):
+        # Test screens; the live signal panel is added below them when the test starts
+        self.test_frame = tk.Frame(self.root)
+        self.test_frame.pack(fill=tk.BOTH, expand=True)
     
         # Initial screen
-        self.initial_frame = tk.Frame(self.root)
+        self.initial_frame = tk.Frame(self.test_frame)
         self.initial_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         self.title_label = tk.Label(self.initial_frame, text="Musical Flow State Test", font=("Arial", 24, "bold"))
         self.title_label.pack(pady=10)
@@ -161,27 +889,43 @@ class FlowStateTestApp:
         self.start_button.pack(pady=20)
     
         # Test information screen
-        self.test_info_frame = tk.Frame(self.root)
+        self.test_info_frame = tk.Frame(self.test_frame)
         self.test_info_label = tk.Label(self.test_info_frame, text="There are four testing intervals with a break between each. In each testing interval, you will be solving derivatives of polynomials. In the first testing interval, you will do so without music. For the next three testing intervals, a random song from a random genre will be chosen. During these tests, the band power of your brain waves will be measured.", font=("Arial", 10), wraplength=300)
         self.test_info_label.pack(pady=20)
         self.continue_button = tk.Button(self.test_info_frame, text="Continue", command=self.start_timer, font=("Arial", 16), padx=20, pady=10)
         self.continue_button.pack(pady=20)
 
-        self.test_interval_label = tk.Label(self.root, text="", font=("Arial", 16))
-        self.timer_label = tk.Label(self.root, text="", font=("Arial", 24), wraplength=300)
-        self.break_label = tk.Label(self.root, text="", font=("Arial", 18), fg="gray", wraplength=300)
-        self.continue_button = tk.Button(self.root, text="Continue", command=self.on_continue, state=tk.DISABLED, fg="gray")
-        self.udp_listeners = []
+        self.test_interval_label = tk.Label(self.test_frame, text="", font=("Arial", 16))
+        self.timer_label = tk.Label(self.test_frame, text="", font=("Arial", 24), wraplength=300)
+        self.break_label = tk.Label(self.test_frame, text="", font=("Arial", 18), fg="gray", wraplength=300)
+        self.continue_button = tk.Button(self.test_frame, text="Continue", command=self.on_continue, state=tk.DISABLED, fg="gray")
         
-        self.derivative_label = tk.Label(self.root, text="Find the derivative of:", font=("Arial", 14))
-        self.polynomial_label = tk.Label(self.root, text="", font=("Arial", 16), wraplength=300)
-        self.user_input = tk.Entry(self.root, font=("Arial", 16))
-        self.check_button = tk.Button(self.root, text="Check Answer", command=self.check_answer)
-        self.result_label = tk.Label(self.root, text="", font=("Arial", 16))
+        self.derivative_label = tk.Label(self.test_frame, text="Find the derivative of:", font=("Arial", 14))
+        self.polynomial_label = tk.Label(self.test_frame, text="", font=("Arial", 16), wraplength=300)
+        self.user_input = tk.Entry(self.test_frame, font=("Arial", 16))
+        self.check_button = tk.Button(self.test_frame, text="Check Answer", command=self.check_answer)
+        self.result_label = tk.Label(self.test_frame, text="", font=("Arial", 16))
         self.correct_answers = 0
         
         self.user_input.bind('<Return>', self.check_input_and_answer)
     
+    def on_map(self, event):
+        # Heavy imports and problem generation start once the window is up, while the intro screens are read
+        if event.widget is not self.root or self.warmup is not None:
+            return
+        if self.profiler:
+            self.profiler.mark("first window shown")
+        self.warmup = start_warmup(profiler=self.profiler)
+        self.problem_pool.start()
+        if self.profiler:
+            self.root.after(100, self.report_startup)
+
+    def report_startup(self):
+        if self.warmup.is_alive():
+            self.root.after(100, self.report_startup)
+            return
+        print(self.profiler.report())
+
     def show_test_info(self):
        self.initial_frame.place_forget()
        self.test_info_frame.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
@@ -196,27 +940,44 @@ class FlowStateTestApp:
         self.test_interval_label.config(text=f"Test Interval {self.current_cycle}")
         self.timer_label.place(relx=0.5, rely=0.3, anchor=tk.CENTER)
         print("Test 1: None")
-        self.countdown(TIMER_DURATION_SECONDS)
-        self.start_udp_listener()
+        self.start_interval()
+        if LIVE_PLOT:
+            self.show_live_plot()
         self.generate_polynomial()
     
+    def show_live_plot(self):
+        if self.live_plot is None:
+            self.live_plot = LivePlot(self.root, lambda: self.udp_listener.samples)
+            self.live_plot.widget.pack(side=tk.BOTTOM, fill=tk.X, before=self.test_frame)
+        self.live_plot.start()
+
     def start_udp_listener(self):
-        self.udp_listener = UDPListener(self)
-        self.udp_listeners.append(self.udp_listener)
-        self.udp_listener.start()
+        # The listener keeps its socket open for the whole session; each interval is a logical segment
+        if not self.udp_listener.is_alive():
+            self.udp_listener = UDPListener(self, clock=self.clock)
+            self.udp_listener.start()
+        return self.udp_listener.begin_interval(TIMER_DURATION_SECONDS, self.log_dir, fixed_length=True)
+
+    def start_interval(self):
+        # The interval's length is fixed when it begins: the listener cuts the recording exactly
+        # TIMER_DURATION_SECONDS after its start, and the countdown, the music cut-off and the interval
+        # end are deadlines at that same moment, all on the monotonic sample clock
+        interval = self.start_udp_listener()
+        deadline_ns = interval.start_ns + TIMER_DURATION_SECONDS * 1_000_000_000
+        self.countdown(deadline_ns)
+        return deadline_ns
     
-    def countdown(self, seconds):
+    def countdown(self, deadline_ns):
+        seconds = -(-(deadline_ns - self.clock.monotonic_ns()) // 1_000_000_000)
         self.timer_running = True
         self.remaining_time = seconds
         if seconds <= 0:
             self.timer_running = False
             self.remaining_time = 0
             self.hide_polynomial_question()
+            # Stop the music first so its final track_stop record lands in this interval's log
+            self.music_player.stop("deadline")
             self.stop_udp_listener()
-            self.create_summary_log()
-            self.create_graph()
-            if self.current_cycle != 1:
-                mixer.music.stop()
             if self.current_cycle == MAX_CYCLES:
                 self.timer_label.config(text="Congratulations!\nYou have completed the Musical Flow State Test!")
                 self.continue_button.place_forget()
@@ -227,28 +988,73 @@ class FlowStateTestApp:
                 self.break_label.config(text=f"{BREAK_DURATION_SECONDS // 60:02d}:{BREAK_DURATION_SECONDS % 60:02d}")
                 self.continue_button.config(state=tk.DISABLED, fg="gray")
                 self.continue_button.place(relx=0.5, rely=0.8, anchor=tk.CENTER)
-                self.break_countdown(BREAK_DURATION_SECONDS)
+                self.break_countdown(deadline_ns + BREAK_DURATION_SECONDS * 1_000_000_000)
+                self.music_player.prepare(self.current_cycle + 1)
         else:
             minutes = seconds // 60
             remaining_seconds = seconds % 60
             self.timer_label.config(text=f"{minutes:02d}:{remaining_seconds:02d}")
             self.remaining_time = seconds
-            self.root.after(1000, self.countdown, seconds - 1)
+            # The next tick is when the display next changes, counted back from the deadline so a late
+            # tick doesn't delay the ones after it
+            self.scheduler.call_at(deadline_ns - (seconds - 1) * 1_000_000_000, self.countdown, deadline_ns)
     
     def stop_udp_listener(self):
-        for listener in self.udp_listeners:
-            listener.stop()
-            listener.join()
-        self.udp_listeners = []
+        # Marking the end is instant; draining, the summary, graphs and closing the logs run on a
+        # worker against the frozen interval so the break screen appears immediately
+        interval = self.udp_listener.end_interval()
+        if interval is None:
+            return
+        context = {
+            "cycle": self.current_cycle,
+            "genre": ", ".join(self.music_player.played_genres) if self.current_cycle > 1 else None,
+            "played_songs": list(self.music_player.played_songs),
+            "track_start_latencies_ms": list(self.music_player.track_start_latencies_ms) if self.current_cycle > 1 else [],
+            "correct_answers": self.correct_answers,
+            "recorded_seconds": (interval.end_ns - interval.start_ns) / 1e9,
+            "timer_lateness": self.scheduler.reset_lateness(),
+        }
+        lateness = context["timer_lateness"]
+        print(f"Test {self.current_cycle}: recorded {context['recorded_seconds']:.6f} s, timer lateness "
+              f"p50 {lateness.get('p50_us', 0):.0f} us, p99 {lateness.get('p99_us', 0):.0f} us, max {lateness.get('max_us', 0):.0f} us")
+        future = self.finalizer.submit(self.finalize_interval, interval, context)
+        self.pending_finalizations.append((context["cycle"], future))
+        if len(self.pending_finalizations) == 1:
+            self.root.after(FINALIZE_POLL_MS, self.check_finalizations)
+
+    def finalize_interval(self, interval, context):
+        self.udp_listener.finish_interval(interval)
+        if context["cycle"] == 1:
+            # The no-music interval is the baseline later flow scores are measured against
+            ratio = interval.stats.whole.theta_alpha_ratio
+            if ratio.count > 1:
+                self.udp_listener.flow_score.set_baseline(ratio.average, ratio.std)
+            else:
+                print("WARNING: Not enough data in test interval 1 for a flow score baseline")
+        # The summary and graphs are named like the interval's detailed log, which graph_renderer.py
+        # relies on when re-rendering
+        self.create_summary_log(interval, context, interval.log_stamp)
+        self.create_graph(interval, interval.log_stamp)
+
+    def check_finalizations(self):
+        for cycle, future in [pending for pending in self.pending_finalizations if pending[1].done()]:
+            self.pending_finalizations.remove((cycle, future))
+            error = future.exception()
+            if error:
+                print(f"ERROR: Saving results for test interval {cycle} failed: {error!r}")
+            else:
+                print(f"Test {cycle}: summary and graphs saved")
+        if self.pending_finalizations:
+            self.root.after(FINALIZE_POLL_MS, self.check_finalizations)
     
     def on_continue(self):
+        requested_ns = time.perf_counter_ns()
         self.current_cycle += 1
         self.test_interval_label.config(text=f"Test Interval {self.current_cycle}")
         self.break_label.place_forget()
         self.continue_button.place_forget()
-        self.countdown(TIMER_DURATION_SECONDS)
-        self.music_player.play_music(self.current_cycle)
-        self.start_udp_listener()
+        deadline_ns = self.start_interval()
+        self.music_player.play_music(self.current_cycle, requested_ns, deadline_ns)
         self.correct_answers = 0
         self.generate_polynomial()
         self.show_polynomial_question()
@@ -256,7 +1062,8 @@ class FlowStateTestApp:
     def get_remaining_time(self):
         return self.remaining_time
     
-    def break_countdown(self, seconds):
+    def break_countdown(self, deadline_ns):
+        seconds = -(-(deadline_ns - self.clock.monotonic_ns()) // 1_000_000_000)
         if seconds <= 0:
             self.break_label.place_forget()
             self.continue_button.config(state=tk.NORMAL, fg="black")
@@ -264,7 +1071,7 @@ class FlowStateTestApp:
             minutes = seconds // 60
             remaining_seconds = seconds % 60
             self.break_label.config(text=f"{minutes:02d}:{remaining_seconds:02d}")
-            self.root.after(1000, self.break_countdown, seconds - 1)
+            self.scheduler.call_at(deadline_ns - (seconds - 1) * 1_000_000_000, self.break_countdown, deadline_ns)
 
     def show_polynomial_question(self):
         self.derivative_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
@@ -282,14 +1089,10 @@ class FlowStateTestApp:
         self.result_label.place_forget()
             
     def generate_polynomial(self):
-        coefficients = [random.randint(-9, 9) for _ in range(3)]
-        exponents = set()
-        while len(exponents) < 3:
-            exponents.add(random.randint(-1, 5))
-        exponents = list(exponents)
-        x = sp.Symbol('x')
-        self.polynomial = sum(coeff * x ** exp for coeff, exp in zip(coefficients, exponents))
-        self.polynomial_label.config(text=str(sp.expand(self.polynomial)).replace('**', '^').replace('*', ''))
+        # Problems come pre-built from the pool's worker thread, so nothing is computed here
+        self.problem = self.problem_pool.next_problem()
+        self.polynomial = self.problem.polynomial
+        self.polynomial_label.config(text=self.problem.display)
     
         self.derivative_label.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
         self.polynomial_label.place(relx=0.5, rely=0.6, anchor=tk.CENTER)
@@ -301,22 +1104,15 @@ class FlowStateTestApp:
     def check_answer(self):
         user_derivative = self.user_input.get()
         try:
-            user_derivative = user_derivative.replace('^', '**')
-            user_derivative = ''.join(
-                f'{char}*' if char.isdigit() and next_char.isalpha() else char
-                for char, next_char in zip(user_derivative, user_derivative[1:] + ' ')
-            )
-            user_derivative = re.sub(r'(\d+)(x)\^-(\d+)', r'\1/(\2**\3)', user_derivative)
-            user_derivative = sp.sympify(user_derivative)
-            actual_derivative = sp.diff(self.polynomial)
-            if sp.simplify(user_derivative - actual_derivative) == 0:
+            correct, _ = check_derivative(user_derivative, self.problem.derivative_coefficients, self.problem.derivative)
+            if correct:
                 self.result_label.config(text="Correct!", fg="green")
                 self.correct_answers += 1
                 print(f"Correct! Total Correct Answers: {self.correct_answers}")
                 self.generate_polynomial()  # Generate a new polynomial on a correct answer
             else:
                 self.result_label.config(text="Incorrect", fg="red")
-        except sp.SympifyError:
+        except ValueError:  # includes sympy's SympifyError
             self.result_label.config(text="Invalid input", fg="red")
             
     def check_input_and_answer(self, event):
@@ -324,103 +1120,116 @@ class FlowStateTestApp:
         if user_input:
             self.check_answer()
     
-    def create_summary_log(self):
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        summary_log_file_path = os.path.join("logs", f"{timestamp}_summary_log.txt")
+    def create_summary_log(self, interval, context, timestamp):
+        summary_log_file_path = os.path.join(self.log_dir, f"{timestamp}_summary_log.txt")
     
         with open(summary_log_file_path, "w") as summary_log_file:
-            summary_log_file.write(f"Test Interval {self.current_cycle}:\n")
-            summary_log_file.write(f"Genre: {self.music_player.used_genres[-1] if self.current_cycle > 1 else 'None'}\n")
-            summary_log_file.write(f"Played Songs: {', '.join(self.music_player.played_songs) if self.current_cycle > 1 else 'None'}\n\n")
-            summary_log_file.write(f"Correct Answers: {self.correct_answers}\n\n")
-
-            num_samples = len(self.udp_listener.band_powers)
-            if num_samples > 0:
-                avg_band_powers_whole = [sum(x[i] for x in self.udp_listener.band_powers) / num_samples for i in range(5)]
+            summary_log_file.write(f"Test Interval {context['cycle']}:\n")
+            summary_log_file.write(f"Genre: {context['genre'] if context['cycle'] > 1 else 'None'}\n")
+            summary_log_file.write(f"Played Songs: {', '.join(context['played_songs']) if context['cycle'] > 1 else 'None'}\n\n")
+            summary_log_file.write(f"Correct Answers: {context['correct_answers']}\n\n")
+            if context["track_start_latencies_ms"]:
+                summary_log_file.write("Track Start Latency (ms):\n")
+                summary_log_file.write(json.dumps([round(latency, 3) for latency in context["track_start_latencies_ms"]]) + "\n\n")
+            # Recorded window between the interval markers on the sample clock, and how late the
+            # scheduled callbacks ran against their deadlines since the previous interval ended (its
+            # break countdown included)
+            summary_log_file.write("Interval Timing:\n")
+            summary_log_file.write(json.dumps({
+                "planned_seconds": TIMER_DURATION_SECONDS,
+                "recorded_seconds": context["recorded_seconds"],
+                "timer_lateness_us": context["timer_lateness"],
+            }) + "\n\n")
+
+            # Running statistics kept by the listener, so nothing is re-scanned here
+            whole = interval.stats.whole
+            middle = interval.stats.segments["middle_third"]
+            if whole.count > 0:
                 summary_log_file.write(f"Average Band Powers (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
-                summary_log_file.write(json.dumps(avg_band_powers_whole) + "\n\n")
+                summary_log_file.write(json.dumps(whole.band_powers.average.tolist()) + "\n\n")
     
-            if num_samples > 0:
-                start_index = num_samples // 3
-                end_index = 2 * start_index
-                avg_band_powers_middle = [sum(x[i] for x in self.udp_listener.band_powers[start_index:end_index]) / (end_index - start_index) for i in range(5)]
+            if middle.count > 0:
                 summary_log_file.write("Average Band Powers (Middle Third):\n")
-                summary_log_file.write(json.dumps(avg_band_powers_middle) + "\n\n")
+                summary_log_file.write(json.dumps(middle.band_powers.average.tolist()) + "\n\n")
     
-            if len(self.udp_listener.theta_alpha_ratios) > 0:
-                avg_theta_alpha_whole = sum(self.udp_listener.theta_alpha_ratios) / len(self.udp_listener.theta_alpha_ratios)
+            if whole.count > 0:
                 summary_log_file.write(f"Average Theta/Average Alpha Ratio (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
-                summary_log_file.write(str(avg_theta_alpha_whole) + "\n\n")
+                summary_log_file.write(str(float(whole.theta_alpha_ratio.average)) + "\n\n")
     
-                avg_theta_alpha_middle = sum(self.udp_listener.theta_alpha_ratios[start_index:end_index]) / (end_index - start_index)
+            if middle.count > 0:
                 summary_log_file.write("Average Theta/Average Alpha Ratio (Middle Third):\n")
-                summary_log_file.write(str(avg_theta_alpha_middle) + "\n\n")
+                summary_log_file.write(str(float(middle.theta_alpha_ratio.average)) + "\n\n")
                 
-            if len(self.udp_listener.per_channel_theta_alpha_ratios) > 0:
-                per_channel_theta_alpha_whole = [sum(row[i] for row in self.udp_listener.per_channel_theta_alpha_ratios) / len(self.udp_listener.per_channel_theta_alpha_ratios) for i in range(self.udp_listener.num_channels)]
+            if whole.count > 0:
+                per_channel_theta_alpha_whole = whole.per_channel_theta_alpha_ratio.average
                 summary_log_file.write(f"Per Channel Theta/Alpha Ratio (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
-                summary_log_file.write(str(per_channel_theta_alpha_whole) + "\n\n")
+                summary_log_file.write(str(per_channel_theta_alpha_whole.tolist()) + "\n\n")
                 
-                per_channel_theta_alpha_middle = [sum(row[i] for row in self.udp_listener.per_channel_theta_alpha_ratios[start_index:end_index]) / (end_index - start_index) for i in range(self.udp_listener.num_channels)]
+            if middle.count > 0:
+                per_channel_theta_alpha_middle = middle.per_channel_theta_alpha_ratio.average
                 summary_log_file.write("Per Channel Theta/Alpha Ratio (Middle Third):\n")
-                summary_log_file.write(str(per_channel_theta_alpha_middle) + "\n\n")
+                summary_log_file.write(str(per_channel_theta_alpha_middle.tolist()) + "\n\n")
                 
-                avg_per_channel_theta_alpha_whole = sum(per_channel_theta_alpha_whole) / self.udp_listener.num_channels
+            if whole.count > 0:
                 summary_log_file.write(f"Average Per Channel Theta/Alpha Ratio (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
-                summary_log_file.write(str(avg_per_channel_theta_alpha_whole) + "\n\n")
+                summary_log_file.write(str(float(np.nanmean(per_channel_theta_alpha_whole))) + "\n\n")
                 
-                avg_per_channel_theta_alpha_middle = sum(per_channel_theta_alpha_middle) / self.udp_listener.num_channels
+            if middle.count > 0:
                 summary_log_file.write("Average Per Channel Theta/Alpha Ratio (Middle Third):\n")
-                summary_log_file.write(str(avg_per_channel_theta_alpha_middle) + "\n\n")
-    
-    def create_graph(self):
-        if not self.udp_listener.timestamps:
+                summary_log_file.write(str(float(np.nanmean(per_channel_theta_alpha_middle))) + "\n\n")
+
+            if whole.count > 0:
+                ratio = whole.theta_alpha_ratio
+                summary_log_file.write(f"Theta/Alpha Ratio Statistics (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
+                summary_log_file.write(json.dumps({
+                    "samples": ratio.count,
+                    "std": float(ratio.std),
+                    "min": float(ratio.min),
+                    "max": float(ratio.max),
+                }) + "\n\n")
+                summary_log_file.write(f"Band Power Standard Deviation (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
+                summary_log_file.write(json.dumps(whole.band_powers.std.tolist()) + "\n\n")
+                # Channels flagged invalid (non-finite bands or no alpha power) are left out of every statistic above
+                summary_log_file.write("Channel Validity (fraction of samples usable, per channel):\n")
+                validity = whole.per_channel_theta_alpha_ratio.counts / len(interval.samples)
+                summary_log_file.write(json.dumps([round(float(fraction), 4) for fraction in validity]) + "\n\n")
+
+            # Derived features from the registry in features.py, by name
+            feature_names = interval.samples.feature_names
+            if whole.count > 0:
+                summary_log_file.write(f"Feature Averages (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
+                summary_log_file.write(json.dumps(dict(zip(feature_names, whole.features.average.tolist()))) + "\n\n")
+                summary_log_file.write(f"Feature Standard Deviation (Duration: {TIMER_DURATION_SECONDS} seconds):\n")
+                summary_log_file.write(json.dumps(dict(zip(feature_names, whole.features.std.tolist()))) + "\n\n")
+
+            if middle.count > 0:
+                summary_log_file.write("Feature Averages (Middle Third):\n")
+                summary_log_file.write(json.dumps(dict(zip(feature_names, middle.features.average.tolist()))) + "\n\n")
+
+    def create_graph(self, interval, timestamp):
+        if len(interval.samples) == 0:
             print("WARNING: No data saved.")
             return
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        self.create_theta_alpha_graph(timestamp)
-        self.create_theta_alpha_ratio_graph(timestamp)
-    
-    def create_theta_alpha_graph(self, timestamp):
-        start_time = self.udp_listener.timestamps[0]
-        seconds_since_start = [(t - start_time).total_seconds() for t in self.udp_listener.timestamps]
-        
-        graph_file_path = os.path.join("logs", f"{timestamp}_theta_alpha_graph.png")
-        
-        plt.figure(figsize=(10, 6))
-        plt.plot(seconds_since_start, self.udp_listener.theta_values, label='Theta', color='blue')
-        plt.plot(seconds_since_start, self.udp_listener.alpha_values, label='Alpha', color='green')
-        
-        plt.xlabel('Time (seconds)')
-        plt.ylabel('Value')
-        plt.title('Theta and Alpha Over Time')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(graph_file_path)
-        plt.close()
-    
-    def create_theta_alpha_ratio_graph(self, timestamp):
-        start_time = self.udp_listener.timestamps[0]
-        seconds_since_start = [(t - start_time).total_seconds() for t in self.udp_listener.timestamps]
-        
-        graph_file_path = os.path.join("logs", f"{timestamp}_theta_alpha_ratio_graph.png")
-        
-        plt.figure(figsize=(10, 6))
-        plt.plot(seconds_since_start, self.udp_listener.theta_alpha_ratios, label='Theta/Alpha Ratio', color='red')
-        
-        plt.xlabel('Time (seconds)')
-        plt.ylabel('Theta/Alpha Ratio')
-        plt.title('Theta/Alpha Ratio Over Time')
-        plt.legend()
-        plt.grid(True)
-        plt.savefig(graph_file_path)
-        plt.close()
+        futures = self.graph_renderer.render_interval(os.path.join(self.log_dir, timestamp), interval.samples.timestamps,
+                                                      interval.samples.averages)
+        for future in futures:
+            future.result()
     
     def on_closing(self):
-        mixer.quit()
+        if self.live_plot:
+            self.live_plot.stop()
+        self.music_player.stop()
+        self.music_player.close()
+        self.problem_pool.close()
         if self.udp_listener.is_alive():
             self.udp_listener.stop()
             self.udp_listener.join()
+        # Let queued summaries and graphs finish so no interval is left half-written
+        self.finalizer.shutdown(wait=True)
+        self.graph_renderer.shutdown(wait=True)
+        if self.udp_listener.detailed_log_writer:
+            # Let the last interval's log reach disk before the process exits
+            self.udp_listener.detailed_log_writer.join()
         self.root.destroy()
         
     def on_quit(self, event=None):
@@ -434,7 +1243,11 @@ if __name__ == "__main__":
 
     signal.signal(signal.SIGINT, signal_handler)
 
+    if STARTUP_PROFILER:
+        STARTUP_PROFILER.mark("imports finished")
     root = tk.Tk()
-    app = FlowStateTestApp(root)
+    app = FlowStateTestApp(root, STARTUP_PROFILER)
+    if STARTUP_PROFILER:
+        STARTUP_PROFILER.mark("app initialised")
     root.bind("<<Quit>>", app.on_quit)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,53 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from answer_checker import check_derivative, check_with_sympy, format_answer
+from problem_pool import generate_problem
+
+
+def measure(check, cases, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for answer, problem in cases:
+            start = time.perf_counter_ns()
+            check(answer, problem)
+            latencies.append(time.perf_counter_ns() - start)
+    return np.array(latencies) / 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare answer-check latency of the Laurent polynomial parser with sympy")
+    parser.add_argument("--problems", type=int, default=200, help="random problems per answer style")
+    parser.add_argument("--repeat", type=int, default=3, help="times each answer is checked")
+    parser.add_argument("--difficulty", default="normal")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    problems = [generate_problem(args.difficulty, rng) for _ in range(args.problems)]
+    styles = {
+        "correct, a/x^n": [(format_answer(p.derivative_coefficients, "slash"), p) for p in problems],
+        "correct, ax^-n": [(format_answer(p.derivative_coefficients, "power"), p) for p in problems],
+        "wrong by one": [(format_answer({**p.derivative_coefficients, 0: p.derivative_coefficients.get(0, 0) + 1}), p)
+                         for p in problems],
+    }
+    checks = {
+        "sympy": lambda answer, p: check_with_sympy(answer, p.derivative),
+        "parser": lambda answer, p: check_derivative(answer, p.derivative_coefficients, p.derivative)[0],
+    }
+
+    print(f"{'answers':<16} {'check':<7} {'p50 (us)':>10} {'p99 (us)':>10} {'max (us)':>10}")
+    for style, cases in styles.items():
+        results = {name: [check(answer, p) for answer, p in cases] for name, check in checks.items()}
+        assert results["sympy"] == results["parser"], f"{style}: parser and sympy disagree"
+        for name, check in checks.items():
+            latencies = measure(check, cases, args.repeat)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{style:<16} {name:<7} {p50:>10.1f} {p99:>10.1f} {latencies.max():>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bci_flow_state_test import UDPListener
+from stream_simulator import standalone_app
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stream_simulator.py")
+
+
+def run_rate(listener, args, rate, log_dir):
+    # One interval per rate; the simulator runs in its own process so sending doesn't compete with
+    # the listener for the GIL
+    interval = listener.begin_interval(args.duration, log_dir)
+    command = [sys.executable, SIMULATOR, "--json", "--port", str(args.port), "--rate", str(rate),
+               "--duration", str(args.duration), "--channels", str(args.channels), "--burst", str(args.burst),
+               "--jitter-ms", str(args.jitter_ms), "--malformed", str(args.malformed), "--seed", str(args.seed)]
+    sent = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+    time.sleep(0.1)
+    listener.end_interval()
+    listener.finish_interval(interval)
+    counts = interval.packet_counts
+    recorded = len(interval.samples)
+    lost = max(sent["band_power"] - recorded, 0)
+    return {
+        "rate": rate,
+        "sent": sent["sent"],
+        "recorded": recorded,
+        "packets_per_second": recorded / sent["elapsed_seconds"],
+        "drop_rate": lost / sent["band_power"] if sent["band_power"] else 0.0,
+        "kernel_dropped": counts["dropped"],
+        "queue_dropped": interval.queue_dropped,
+        "malformed": counts["malformed"] + counts["truncated"],
+        "processing": listener.processing_latency.summary(),
+        "queue": listener.queue_latency.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test UDPListener with the stream simulator")
+    parser.add_argument("--rates", type=float, nargs="+", default=[250, 1000, 5000, 20000], help="packets per second to try")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per rate")
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--malformed", type=float, default=0)
+    parser.add_argument("--port", type=int, default=12399, help="kept off the app's port so a running test isn't disturbed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines instead of a table")
+    args = parser.parse_args()
+
+    # Detailed logs and session files are written as in a real session, into a throwaway folder
+    with tempfile.TemporaryDirectory() as log_folder:
+        listener = UDPListener(standalone_app(), ("127.0.0.1", args.port))
+        listener.start()
+        if not listener.bound.wait(5):
+            raise SystemExit("the listener could not bind its socket")
+        results = [run_rate(listener, args, rate, log_folder) for rate in args.rates]
+        listener.stop()
+        listener.join()
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    print(f"{'rate':>8} {'sent':>8} {'recorded':>9} {'pkts/s':>9} {'drop %':>7} {'kernel':>7} {'queue':>6} {'malformed':>9}"
+          f" {'proc p50':>9} {'proc p99':>9} {'proc max':>9} {'queue p50':>10} {'queue p99':>10}  (latencies in us)")
+    for result in results:
+        processing, queue = result["processing"], result["queue"]
+        print(f"{result['rate']:>8.0f} {result['sent']:>8} {result['recorded']:>9} {result['packets_per_second']:>9.0f}"
+              f" {result['drop_rate'] * 100:>7.2f} {result['kernel_dropped']:>7} {result['queue_dropped']:>6}"
+              f" {result['malformed']:>9} {processing.get('p50_us', 0):>9.1f} {processing.get('p99_us', 0):>9.1f}"
+              f" {processing.get('max_us', 0):>9.1f} {queue.get('p50_us', 0):>10.1f} {queue.get('p99_us', 0):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
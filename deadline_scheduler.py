@@ -0,0 +1,53 @@
+import itertools
+import time
+
+from ingest_pipeline import StageLatency
+
+
+def ms_until(remaining_ns):
+    # Whole milliseconds for root.after, rounded up so a callback is never asked to run early
+    return max(0, -(-remaining_ns // 1_000_000))
+
+
+class DeadlineScheduler:
+    # Runs callbacks at absolute deadlines on the clock's monotonic_ns(), through root.after; the app
+    # times intervals, breaks and the music cut-off with it. Every
+    # deadline is fixed when it is scheduled rather than counted from the previous callback, so a
+    # stalled event loop makes one callback late without pushing back everything after it. A callback
+    # Tk fires before its deadline is re-armed for the remainder; how late each one actually ran is
+    # kept in lateness (nanoseconds, see StageLatency) as the measured timer jitter.
+    def __init__(self, root, clock=time):
+        self.root = root
+        self.clock = clock
+        self.lateness = StageLatency()
+        self.pending = {}
+        self.handles = itertools.count()
+
+    def call_at(self, deadline_ns, func, *args):
+        handle = next(self.handles)
+        self.arm(handle, deadline_ns, func, args)
+        return handle
+
+    def arm(self, handle, deadline_ns, func, args):
+        remaining_ns = deadline_ns - self.clock.monotonic_ns()
+        self.pending[handle] = self.root.after(ms_until(remaining_ns), self.fire, handle, deadline_ns, func, args)
+
+    def fire(self, handle, deadline_ns, func, args):
+        now_ns = self.clock.monotonic_ns()
+        if now_ns < deadline_ns:
+            self.arm(handle, deadline_ns, func, args)
+            return
+        del self.pending[handle]
+        self.lateness.add(now_ns - deadline_ns)
+        func(*args)
+
+    def cancel(self, handle):
+        after_id = self.pending.pop(handle, None)
+        if after_id is not None:
+            self.root.after_cancel(after_id)
+
+    def reset_lateness(self):
+        # Returns the lateness summary so far and starts a new one
+        summary = self.lateness.summary()
+        self.lateness = StageLatency()
+        return summary
@@ -0,0 +1,69 @@
+import numpy as np
+
+BANDS = ("delta", "theta", "alpha", "beta", "gamma")
+
+# Derived features computed for every sample, in this order, beside the theta/alpha ratios the sample
+# store always keeps (so theta/alpha isn't listed again here). Two kinds:
+#   ratio: sum of the numerator bands over sum of the denominator bands, on the channel averages
+#   asymmetry: ln(band power on the right channel) - ln(band power on the left channel), by channel index
+# Channel indices follow the OpenBCI Cyton default montage (0 = Fp1, 1 = Fp2, 2 = C3, 3 = C4,
+# 4 = P7, 5 = P8, 6 = O1, 7 = O2); change them if the electrodes are placed differently.
+FEATURES = {
+    "beta_alpha_theta": {"type": "ratio", "numerator": ("beta",), "denominator": ("alpha", "theta")},
+    "beta_theta": {"type": "ratio", "numerator": ("beta",), "denominator": ("theta",)},
+    "frontal_alpha_asymmetry": {"type": "asymmetry", "band": "alpha", "left": 0, "right": 1},
+}
+
+
+class FeatureExtractor:
+    # The registry compiled for a given channel count: every ratio becomes a column of a numerator
+    # and a denominator weight matrix, every asymmetry an entry in channel and band index arrays.
+    # compute() is then two matrix products and one gather per call, however many features there
+    # are, and works the same on one sample or a block of them.
+    def __init__(self, num_channels, features=FEATURES):
+        self.names = list(features)
+        ratio_columns, numerator, denominator = [], [], []
+        asymmetry_columns, left, right, band = [], [], [], []
+        for column, (name, spec) in enumerate(features.items()):
+            if spec["type"] == "ratio":
+                ratio_columns.append(column)
+                numerator.append([band_name in spec["numerator"] for band_name in BANDS])
+                denominator.append([band_name in spec["denominator"] for band_name in BANDS])
+            elif spec["type"] == "asymmetry":
+                if max(spec["left"], spec["right"]) >= num_channels:
+                    print(f"WARNING: Feature {name} needs channels {spec['left']} and {spec['right']}, "
+                          f"but only {num_channels} are streamed; it will be NaN")
+                    continue
+                asymmetry_columns.append(column)
+                left.append(spec["left"])
+                right.append(spec["right"])
+                band.append(BANDS.index(spec["band"]))
+            else:
+                raise ValueError(f"unknown feature type {spec['type']!r} for {name}")
+        self.ratio_columns = np.array(ratio_columns, dtype=np.intp)
+        self.numerator = np.array(numerator, dtype=np.float64).reshape(-1, len(BANDS)).T
+        self.denominator = np.array(denominator, dtype=np.float64).reshape(-1, len(BANDS)).T
+        self.asymmetry_columns = np.array(asymmetry_columns, dtype=np.intp)
+        self.left = np.array(left, dtype=np.intp)
+        self.right = np.array(right, dtype=np.intp)
+        self.band = np.array(band, dtype=np.intp)
+
+    def __len__(self):
+        return len(self.names)
+
+    def compute(self, bands, averages, valid, out=None):
+        # bands (..., channels, bands), averages (..., bands) and valid (..., channels) -> (..., features).
+        # Ratios follow the channel averages (so they leave out invalid channels); an asymmetry is NaN
+        # unless both of its channels are valid.
+        if out is None:
+            out = np.empty(averages.shape[:-1] + (len(self.names),), dtype=np.float64)
+        out.fill(np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if len(self.ratio_columns):
+                out[..., self.ratio_columns] = (averages @ self.numerator) / (averages @ self.denominator)
+            if len(self.asymmetry_columns):
+                log_right = np.log(bands[..., self.right, self.band])
+                log_left = np.log(bands[..., self.left, self.band])
+                both_valid = valid[..., self.right] & valid[..., self.left]
+                out[..., self.asymmetry_columns] = np.where(both_valid, log_right - log_left, np.nan)
+        return out
@@ -0,0 +1,142 @@
+import collections
+import heapq
+import math
+
+EMA_SECONDS = 2.0
+MEDIAN_WINDOW_SECONDS = 5.0
+
+# One published reading. score is the windowed median's z-score against the baseline (NaN until a
+# baseline is set); samples is how many values the median window holds.
+FlowScore = collections.namedtuple("FlowScore", "timestamp_ns ratio ema median score samples")
+
+
+class SlidingMedian:
+    # Median of the values from the last window_ns nanoseconds. The lower half sits in a max-heap
+    # (stored negated) and the upper half in a min-heap; values leaving the window are only
+    # counted in `delayed` and popped once they surface at a heap top (lazy deletion), so every
+    # update is O(log n). Both tops are kept live, and the heaps are rebuilt from the window when
+    # buried stale entries outnumber the live ones.
+    def __init__(self, window_ns):
+        self.window_ns = window_ns
+        self.reset()
+
+    def reset(self):
+        self.window = collections.deque()
+        self.low = []
+        self.high = []
+        self.low_size = 0
+        self.high_size = 0
+        self.delayed = collections.Counter()
+
+    def __len__(self):
+        return len(self.window)
+
+    def add(self, timestamp_ns, value):
+        self.window.append((timestamp_ns, value))
+        if not self.low or value <= -self.low[0]:
+            heapq.heappush(self.low, -value)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, value)
+            self.high_size += 1
+        self._rebalance()
+        cutoff = timestamp_ns - self.window_ns
+        while self.window[0][0] <= cutoff:
+            self._remove(self.window.popleft()[1])
+        if len(self.low) + len(self.high) > 2 * len(self.window) + 64:
+            self._rebuild()
+
+    def _remove(self, value):
+        self.delayed[value] += 1
+        if value <= -self.low[0]:
+            self.low_size -= 1
+            if value == -self.low[0]:
+                self._prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            if value == self.high[0]:
+                self._prune(self.high, 1)
+        self._rebalance()
+
+    def _prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            if not self.delayed[value]:
+                return
+            self.delayed[value] -= 1
+            if not self.delayed[value]:
+                del self.delayed[value]
+            heapq.heappop(heap)
+
+    def _rebalance(self):
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self._prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.low_size += 1
+            self.high_size -= 1
+            self._prune(self.high, 1)
+
+    def _rebuild(self):
+        values = sorted(value for _, value in self.window)
+        middle = (len(values) + 1) // 2
+        self.low = [-value for value in reversed(values[:middle])]
+        self.high = values[middle:]
+        # Sorted lists already satisfy the heap property (the negated lower half in reverse order too)
+        self.low_size = len(self.low)
+        self.high_size = len(self.high)
+        self.delayed.clear()
+
+    @property
+    def median(self):
+        if not self.window:
+            return math.nan
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+class FlowScoreEngine:
+    # Turns the per-packet theta/alpha ratio into a steadier flow signal: a time-based exponential
+    # moving average, a sliding-window median, and the median's z-score against the no-music
+    # baseline (interval 1). add() runs on the processing thread; each update is published as a
+    # new immutable FlowScore in `current`, so other threads read it without a lock.
+    def __init__(self, ema_seconds=EMA_SECONDS, median_window_seconds=MEDIAN_WINDOW_SECONDS):
+        self.ema_ns = ema_seconds * 1e9
+        self.median = SlidingMedian(int(median_window_seconds * 1e9))
+        self.baseline = None
+        self.current = None
+        self.ema = math.nan
+        self.last_timestamp_ns = None
+
+    def set_baseline(self, mean, std):
+        # (mean, std) published together, like current
+        self.baseline = (float(mean), float(std))
+
+    def reset(self):
+        # Start the windows afresh (e.g. at a new interval) so they don't span a break; the baseline is kept
+        self.median.reset()
+        self.ema = math.nan
+        self.last_timestamp_ns = None
+        self.current = None
+
+    def add(self, timestamp_ns, ratio):
+        if not math.isfinite(ratio):
+            return self.current
+        if self.last_timestamp_ns is None:
+            self.ema = ratio
+        else:
+            weight = 1 - math.exp(-max(timestamp_ns - self.last_timestamp_ns, 0) / self.ema_ns)
+            self.ema += weight * (ratio - self.ema)
+        self.last_timestamp_ns = timestamp_ns
+        self.median.add(timestamp_ns, ratio)
+        median = self.median.median
+        score = math.nan
+        baseline = self.baseline
+        if baseline is not None and baseline[1] > 0:
+            score = (median - baseline[0]) / baseline[1]
+        self.current = FlowScore(timestamp_ns, ratio, self.ema, median, score, len(self.median))
+        return self.current
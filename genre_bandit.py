@@ -0,0 +1,131 @@
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime
+
+PRIOR_MEAN = 0.0 # flow scores are z-scores against the no-music baseline, so no effect is the prior guess
+PRIOR_VARIANCE = 1.0
+REWARD_VARIANCE = 1.0 # assumed noise of one decision period's average flow score
+
+
+class GenreBandit:
+    # Picks the genre in ADAPTIVE_GENRES mode, at the start of each interval and again every
+    # ADAPTIVE_DECISION_SECONDS, rewarded with the average flow score the current genre earned.
+    # Gaussian Thompson sampling over genres. Every genre's mean reward has a normal posterior
+    # (conjugate updates with a known reward variance); choose() draws one value per genre from its
+    # posterior and picks the largest, so genres that look good, or are still uncertain, get played.
+    # All randomness comes from one seeded generator and draws happen in genre order, so a run can
+    # be replayed exactly from its seed and the sequence of rewards (see replay_decisions).
+    def __init__(self, genres, seed=None, prior_mean=PRIOR_MEAN, prior_variance=PRIOR_VARIANCE,
+                 reward_variance=REWARD_VARIANCE):
+        if not genres:
+            raise ValueError("at least one genre is needed")
+        self.genres = list(genres)
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.prior_mean = prior_mean
+        self.prior_variance = prior_variance
+        self.reward_variance = reward_variance
+        self.counts = {genre: 0 for genre in self.genres}
+        self.reward_sums = {genre: 0.0 for genre in self.genres}
+
+    def settings(self):
+        return {"genres": self.genres, "seed": self.seed, "prior_mean": self.prior_mean,
+                "prior_variance": self.prior_variance, "reward_variance": self.reward_variance}
+
+    def posterior(self, genre):
+        precision = 1 / self.prior_variance + self.counts[genre] / self.reward_variance
+        mean = (self.prior_mean / self.prior_variance + self.reward_sums[genre] / self.reward_variance) / precision
+        return mean, 1 / precision
+
+    def update(self, genre, reward):
+        self.counts[genre] += 1
+        self.reward_sums[genre] += reward
+
+    def choose(self):
+        draws = {}
+        for genre in self.genres:
+            mean, variance = self.posterior(genre)
+            draws[genre] = self.rng.gauss(mean, math.sqrt(variance))
+        return max(self.genres, key=draws.__getitem__), draws
+
+
+class DecisionLog:
+    # One JSON record per line: the bandit settings first, then every decision with its inputs
+    # (the reward credited just before it, posteriors and draws) and every genre switch. Records are
+    # flushed as they are written, so the log survives a crash mid-session.
+    def __init__(self, path, bandit):
+        self.path = path
+        self.file = open(path, "w")
+        self.write({"event": "session", **bandit.settings()})
+
+    def write(self, record, timestamp_ns=None):
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        record = {"timestamp": datetime.fromtimestamp(timestamp_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S.%f"), **record}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def decide(bandit, reward=None):
+    # Credits reward (genre, value) if there is one, then draws the next genre. Returns the decision
+    # record the decision log stores and replay_decisions checks.
+    start_ns = time.perf_counter_ns()
+    if reward is not None:
+        bandit.update(*reward)
+    posteriors = {genre: bandit.posterior(genre) for genre in bandit.genres}
+    choice, draws = bandit.choose()
+    return {
+        "event": "decision",
+        "reward": None if reward is None else {"genre": reward[0], "value": reward[1]},
+        "posteriors": posteriors,
+        "draws": draws,
+        "choice": choice,
+        "decision_us": round((time.perf_counter_ns() - start_ns) / 1e3, 1),
+    }
+
+
+def replay_decisions(path):
+    # Re-runs a logged session: the same seeded bandit is fed the logged rewards in order and must
+    # draw the same genres. Returns (decisions, mismatches), each mismatch a (line, logged, replayed) tuple.
+    bandit = None
+    decisions = 0
+    mismatches = []
+    with open(path) as log_file:
+        for line_number, line in enumerate(log_file, 1):
+            record = json.loads(line)
+            if record["event"] == "session":
+                bandit = GenreBandit(record["genres"], record["seed"], record["prior_mean"],
+                                     record["prior_variance"], record["reward_variance"])
+            elif record["event"] == "decision":
+                if bandit is None:
+                    raise ValueError(f"{path}:{line_number}: decision before the session record")
+                reward = record["reward"]
+                replayed = decide(bandit, None if reward is None else (reward["genre"], reward["value"]))
+                decisions += 1
+                if replayed["choice"] != record["choice"]:
+                    mismatches.append((line_number, record["choice"], replayed["choice"]))
+            elif record["event"] == "reward":
+                # Credited at an interval's end, before the next decision
+                bandit.update(record["genre"], record["value"])
+    return decisions, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a genre decision log and check every decision is reproduced")
+    parser.add_argument("log", help="a *_genre_decisions.jsonl file written in adaptive mode")
+    args = parser.parse_args()
+    decisions, mismatches = replay_decisions(args.log)
+    for line_number, logged, replayed in mismatches:
+        print(f"line {line_number}: logged {logged}, replayed {replayed}")
+    print(f"{decisions} decisions replayed, {len(mismatches)} differ")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+MAX_POINTS = 2000 # about two points per horizontal pixel of a 10 inch, 100 dpi graph
+DOWNSAMPLING = "minmax" # "minmax", "lttb" or None to plot every sample
+
+GRAPHS = {
+    "theta_alpha": {
+        "series": (("Theta", "blue"), ("Alpha", "green")),
+        "ylabel": "Value",
+        "title": "Theta and Alpha Over Time",
+    },
+    "theta_alpha_ratio": {
+        "series": (("Theta/Alpha Ratio", "red"),),
+        "ylabel": "Theta/Alpha Ratio",
+        "title": "Theta/Alpha Ratio Over Time",
+    },
+}
+
+# Detailed logs first so a binary session file for the same interval takes precedence
+SESSION_SUFFIXES = ("_detailed_log.txt", "_session.bin")
+
+# Figures are built once per worker process and reused; only the line data changes between renders
+_templates = {}
+
+
+def downsample_minmax(x, y, max_points):
+    # Keeps the lowest and highest sample of each bucket (in time order), so spikes and dips survive
+    n = len(x)
+    if n <= max_points or max_points < 2:
+        return x, y
+    bucket_size = -(-n // (max_points // 2))
+    num_buckets = -(-n // bucket_size)
+    padded = np.full(num_buckets * bucket_size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(num_buckets, bucket_size)
+    missing = np.isnan(buckets)
+    lows = np.argmin(np.where(missing, np.inf, buckets), axis=1)
+    highs = np.argmax(np.where(missing, -np.inf, buckets), axis=1)
+    offsets = np.arange(num_buckets) * bucket_size
+    indices = np.sort(np.stack([lows, highs], axis=1), axis=1) + offsets[:, np.newaxis]
+    indices = np.unique(indices[indices < n])
+    return x[indices], y[indices]
+
+
+def downsample_lttb(x, y, max_points):
+    # Largest-Triangle-Three-Buckets: per bucket, keep the point forming the largest triangle with
+    # the previously kept point and the average of the next bucket
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return x, y
+    y_finite = np.where(np.isfinite(y), y, 0.0)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y_finite[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y_finite[start:end] - y_finite[a])
+                       - (x[a] - x[start:end]) * (avg_y - y_finite[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return x[selected], y[selected]
+
+
+def downsample(x, y, max_points=MAX_POINTS, method=DOWNSAMPLING):
+    if method == "minmax":
+        return downsample_minmax(x, y, max_points)
+    if method == "lttb":
+        return downsample_lttb(x, y, max_points)
+    return x, y
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _template(kind):
+    template = _templates.get(kind)
+    if template is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        spec = GRAPHS[kind]
+        figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(figure)
+        ax = figure.subplots()
+        lines = [ax.plot([], [], label=label, color=color)[0] for label, color in spec["series"]]
+        ax.set_xlabel('Time (seconds)')
+        ax.set_ylabel(spec["ylabel"])
+        ax.set_title(spec["title"])
+        ax.legend()
+        ax.grid(True)
+        template = _templates[kind] = (figure, ax, lines)
+    return template
+
+
+def render_graph(kind, path, seconds, series, max_points=MAX_POINTS, method=DOWNSAMPLING):
+    figure, ax, lines = _template(kind)
+    for line, values in zip(lines, series):
+        line.set_data(*downsample(np.asarray(seconds), np.asarray(values), max_points, method))
+    ax.relim()
+    ax.autoscale_view()
+    figure.savefig(path)
+    return path
+
+
+def interval_series(timestamps_ns, channel_averages):
+    # Everything both graphs need, computed once: seconds since the first sample, theta, alpha and their ratio
+    seconds = (timestamps_ns - timestamps_ns[0]) / 1e9
+    theta = channel_averages[:, 1]
+    alpha = channel_averages[:, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(alpha != 0, theta / alpha, np.inf)
+    return seconds, theta, alpha, ratios
+
+
+def render_interval_graphs(path_prefix, seconds, theta, alpha, ratios, max_points=MAX_POINTS, method=DOWNSAMPLING):
+    return [
+        render_graph("theta_alpha", f"{path_prefix}_theta_alpha_graph.png", seconds, (theta, alpha), max_points, method),
+        render_graph("theta_alpha_ratio", f"{path_prefix}_theta_alpha_ratio_graph.png", seconds, (ratios,), max_points, method),
+    ]
+
+
+def load_session(path):
+    # Returns (timestamps_ns, channel_averages) from a binary session file or a JSON-lines detailed log
+    if path.endswith(".bin"):
+        from sample_store import valid_channel_averages
+        from session_format import SessionReader
+
+        with SessionReader(path) as session:
+            return session.timestamps_ns.copy(), valid_channel_averages(session.bands)
+    from session_format import parse_log_timestamp
+
+    timestamps, averages = [], []
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+                averages.append(record["channel_averages"])
+                timestamps.append(parse_log_timestamp(record["timestamp"]))
+            except (ValueError, KeyError):
+                continue
+    return np.array(timestamps, dtype=np.int64), np.array(averages, dtype=np.float64).reshape(-1, 5)
+
+
+def output_prefix(path):
+    # The app names an interval's summary and graphs after its log, so re-rendering replaces them
+    for suffix in SESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return os.path.splitext(path)[0]
+
+
+def render_session(path, max_points=MAX_POINTS, method=DOWNSAMPLING):
+    timestamps_ns, channel_averages = load_session(path)
+    if len(timestamps_ns) == 0:
+        return []
+    return render_interval_graphs(output_prefix(path), *interval_series(timestamps_ns, channel_averages), max_points, method)
+
+
+class GraphRenderer:
+    # Renders graphs in a pool of worker processes using the Agg backend, so neither the GIL nor
+    # the Tk thread is involved. Workers start with "spawn" because the app process runs threads.
+    def __init__(self, max_workers=None, max_points=MAX_POINTS, method=DOWNSAMPLING):
+        self.max_points = max_points
+        self.method = method
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def render_interval(self, path_prefix, timestamps_ns, channel_averages):
+        seconds, theta, alpha, ratios = interval_series(timestamps_ns, channel_averages)
+        return [
+            self.executor.submit(render_graph, "theta_alpha", f"{path_prefix}_theta_alpha_graph.png",
+                                 seconds, (theta, alpha), self.max_points, self.method),
+            self.executor.submit(render_graph, "theta_alpha_ratio", f"{path_prefix}_theta_alpha_ratio_graph.png",
+                                 seconds, (ratios,), self.max_points, self.method),
+        ]
+
+    def render_sessions(self, paths):
+        return {path: self.executor.submit(render_session, path, self.max_points, self.method) for path in paths}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def find_sessions(directory):
+    # Prefer the binary session file when both formats exist for the same interval
+    sessions = {}
+    for suffix in SESSION_SUFFIXES:
+        for path in sorted(glob.glob(os.path.join(directory, f"*{suffix}"))):
+            sessions[path[:-len(suffix)]] = path
+    return list(sessions.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-render theta/alpha graphs for logged sessions in parallel")
+    parser.add_argument("directories", nargs="+", help="directories containing *_detailed_log.txt or *_session.bin files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="points plotted per line after downsampling")
+    parser.add_argument("--downsampling", choices=("minmax", "lttb", "none"), default=DOWNSAMPLING)
+    args = parser.parse_args()
+
+    paths = [path for directory in args.directories for path in find_sessions(directory)]
+    method = None if args.downsampling == "none" else args.downsampling
+    start = time.perf_counter()
+    renderer = GraphRenderer(args.workers, args.max_points, method)
+    failed = 0
+    for path, future in renderer.render_sessions(paths).items():
+        try:
+            for graph_path in future.result():
+                print(graph_path)
+        except Exception as e:
+            failed += 1
+            print(f"ERROR: Rendering {path} failed: {e!r}")
+    renderer.shutdown()
+    print(f"Rendered {len(paths) - failed} of {len(paths)} sessions in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import concurrent.futures
+import heapq
+import itertools
+import os
+import random
+import time
+import tkinter as tk
+from datetime import datetime
+
+import numpy as np
+
+import bci_flow_state_test as app_module
+from answer_checker import format_answer
+from bci_flow_state_test import FlowStateTestApp
+
+PACKET_INTERVAL_MS = 100 # simulated headset sends a bandPower packet this often
+NUM_CHANNELS = 8
+ANSWER_SECONDS = 8 # mean time the simulated subject takes per answer
+ANSWER_ACCURACY = 0.8 # fraction of answers that are correct
+GENRE_EFFECT_STD = 0.15 # spread of the per-genre theta shift (log scale) the simulated subject responds with
+
+
+class VirtualClock:
+    # Stands in for the time module: time_ns() and monotonic_ns() only move when the engine advances
+    # them to the next scheduled event, so a session runs as fast as its callbacks do
+    def __init__(self, start_ns=None):
+        self.start_ns = time.time_ns() if start_ns is None else start_ns
+        self.now_ns = self.start_ns
+
+    def time_ns(self):
+        return self.now_ns
+
+    def monotonic(self):
+        return (self.now_ns - self.start_ns) / 1e9
+
+    def monotonic_ns(self):
+        return self.now_ns - self.start_ns
+
+    def advance_to(self, due_ns):
+        self.now_ns = max(self.now_ns, due_ns)
+
+
+class HeadlessRoot:
+    # The parts of tk.Tk the app uses. after() callbacks go on a heap ordered by virtual due time
+    # (ties in scheduling order, like Tk) and run_next() runs the earliest one.
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+        self.cancelled = set()
+        self.ids = itertools.count()
+
+    def after(self, ms, func, *args):
+        after_id = next(self.ids)
+        heapq.heappush(self.events, (self.clock.time_ns() + int(ms * 1e6), after_id, func, args))
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.cancelled.add(after_id)
+
+    def next_due_ns(self):
+        while self.events and self.events[0][1] in self.cancelled:
+            self.cancelled.discard(heapq.heappop(self.events)[1])
+        return self.events[0][0] if self.events else None
+
+    def run_next(self):
+        if self.next_due_ns() is None:
+            return False
+        due_ns, _, func, args = heapq.heappop(self.events)
+        self.clock.advance_to(due_ns)
+        func(*args)
+        return True
+
+    def title(self, *args):
+        pass
+
+    def geometry(self, *args):
+        pass
+
+    def protocol(self, *args):
+        pass
+
+    def bind(self, *args, **kwargs):
+        pass
+
+    def destroy(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+class HeadlessWidget:
+    # Keeps the options and visibility the engine and the simulated subject look at
+    def __init__(self, text="", state=tk.NORMAL):
+        self.options = {"text": text, "state": state, "fg": "black"}
+        self.visible = False
+
+    def config(self, **options):
+        self.options.update(options)
+
+    def cget(self, option):
+        return self.options[option]
+
+    def place(self, **kwargs):
+        self.visible = True
+
+    def pack(self, **kwargs):
+        self.visible = True
+
+    def place_forget(self):
+        self.visible = False
+
+    def bind(self, *args, **kwargs):
+        pass
+
+
+class HeadlessEntry(HeadlessWidget):
+    def __init__(self):
+        super().__init__()
+        self.text = ""
+
+    def get(self):
+        return self.text
+
+    def delete(self, first, last=None):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+
+class HeadlessFlowStateTest(FlowStateTestApp):
+    # The unchanged protocol (countdowns, breaks, music, problems, logs, summaries and graphs) with
+    # stub widgets, no socket and no live plot; packets are handed to the listener directly.
+    # run_session() drives it on a VirtualClock with a SimulatedSubject, so a full session takes
+    # seconds and writes the same detailed logs, summaries and graphs as a real one.
+    def create_widgets(self):
+        self.initial_frame = HeadlessWidget()
+        self.initial_frame.place()
+        self.start_button = HeadlessWidget("Start")
+        self.start_button.pack()
+        self.test_info_frame = HeadlessWidget()
+        self.test_interval_label = HeadlessWidget()
+        self.timer_label = HeadlessWidget()
+        self.break_label = HeadlessWidget()
+        self.continue_button = HeadlessWidget("Continue", state=tk.DISABLED)
+        self.derivative_label = HeadlessWidget("Find the derivative of:")
+        self.polynomial_label = HeadlessWidget()
+        self.user_input = HeadlessEntry()
+        self.check_button = HeadlessWidget("Check Answer")
+        self.result_label = HeadlessWidget()
+        self.correct_answers = 0
+
+    def show_live_plot(self):
+        pass
+
+    def start_udp_listener(self):
+        return self.udp_listener.begin_interval(app_module.TIMER_DURATION_SECONDS, self.log_dir, fixed_length=True)
+
+
+class SimulatedSubject:
+    # A headset and a person answering. EEG band powers drift slowly around per-channel levels, with
+    # theta shifted by a fixed amount per genre so genres differ in flow score; answers come after
+    # exponentially distributed delays and are right with probability accuracy.
+    def __init__(self, app, seed, answer_seconds=ANSWER_SECONDS, accuracy=ANSWER_ACCURACY):
+        self.app = app
+        self.rng = np.random.default_rng(seed)
+        self.answer_seconds = answer_seconds
+        self.accuracy = accuracy
+        self.levels = self.rng.uniform(2, 20, (NUM_CHANNELS, 5))
+        self.genre_effects = {}
+        self.answers = {}
+
+    def start(self):
+        self.app.root.after(PACKET_INTERVAL_MS, self.send_packet)
+        self.schedule_answer()
+
+    def send_packet(self):
+        listener = self.app.udp_listener
+        now_ns = self.app.clock.monotonic_ns()
+        if listener.interval is not None and listener.interval.accepts(now_ns):
+            self.levels *= self.rng.lognormal(0, 0.02, self.levels.shape)
+            bands = self.levels * self.rng.lognormal(0, 0.1, self.levels.shape)
+            genre = self.app.music_player.current_genre if self.app.current_cycle > 1 else None
+            if genre is not None:
+                if genre not in self.genre_effects:
+                    self.genre_effects[genre] = self.rng.normal(0, GENRE_EFFECT_STD)
+                bands[:, 1] *= np.exp(self.genre_effects[genre])
+            with listener.interval_lock:
+                listener.packet_counts["received"] += 1
+                listener.process_band_power_data(bands, now_ns)
+                listener.interval.update_stats()
+        self.app.root.after(PACKET_INTERVAL_MS, self.send_packet)
+
+    def schedule_answer(self):
+        self.app.root.after(max(1, int(self.rng.exponential(self.answer_seconds) * 1000)), self.answer)
+
+    def answer(self):
+        app = self.app
+        if app.timer_running and app.user_input.visible:
+            coefficients = dict(app.problem.derivative_coefficients)
+            if self.rng.random() >= self.accuracy:
+                coefficients[0] = coefficients.get(0, 0) + 1
+            correct_before = app.correct_answers
+            app.user_input.delete(0, tk.END)
+            app.user_input.insert(0, format_answer(coefficients))
+            app.check_input_and_answer(None)
+            given, correct = self.answers.get(app.current_cycle, (0, 0))
+            self.answers[app.current_cycle] = (given + 1, correct + (app.correct_answers > correct_before))
+        self.schedule_answer()
+
+
+def wait_for_finalizations(app):
+    # Interval 1's finalization sets the flow score baseline; waiting for it keeps a seeded run reproducible
+    concurrent.futures.wait([future for _, future in app.pending_finalizations])
+
+
+def run_session(app, subject, speed=0):
+    # Runs the protocol from the Start button to the end of the last interval. With speed > 0 the
+    # virtual clock is held to speed times real time instead of running flat out.
+    clock, root = app.clock, app.root
+    real_start = time.perf_counter()
+    app.show_test_info()
+    app.start_timer()
+    subject.start()
+    while not (app.current_cycle == app_module.MAX_CYCLES and not app.timer_running):
+        wait_for_finalizations(app)
+        due_ns = root.next_due_ns()
+        if due_ns is None:
+            break
+        if speed > 0:
+            delay = (due_ns - clock.start_ns) / 1e9 / speed - (time.perf_counter() - real_start)
+            if delay > 0:
+                time.sleep(delay)
+        root.run_next()
+        button = app.continue_button
+        if button.visible and button.cget("state") == tk.NORMAL:
+            app.on_continue()
+    wait_for_finalizations(app)
+    app.on_closing()
+    return clock.monotonic(), time.perf_counter() - real_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the whole flow state test headless, on a virtual clock with a simulated subject")
+    parser.add_argument("--seed", type=int, default=0, help="seeds genres, songs, problems, EEG and answers")
+    parser.add_argument("--speed", type=float, default=0, help="0 for as fast as possible, N for N times real time")
+    parser.add_argument("--audio", action="store_true", help="play the music for real (needs --speed 1)")
+    parser.add_argument("--log-dir", help="default: logs/headless_<time>")
+    parser.add_argument("--start", help="virtual start time, e.g. '2024-01-01 12:00:00'; fixing it makes log names reproducible")
+    parser.add_argument("--answer-seconds", type=float, default=ANSWER_SECONDS, help="mean time per answer")
+    parser.add_argument("--accuracy", type=float, default=ANSWER_ACCURACY, help="fraction of correct answers")
+    args = parser.parse_args()
+    if args.audio and args.speed != 1:
+        parser.error("--audio plays tracks in real time, so it needs --speed 1")
+
+    start_ns = int(datetime.fromisoformat(args.start).timestamp() * 1e9) if args.start else None
+    clock = VirtualClock(start_ns)
+    log_dir = args.log_dir or os.path.join(app_module.LOG_FOLDER, datetime.now().strftime("headless_%Y%m%d%H%M%S"))
+    random.seed(args.seed)
+    app = HeadlessFlowStateTest(HeadlessRoot(clock), clock=clock, audio=args.audio, log_dir=log_dir)
+    subject = SimulatedSubject(app, args.seed, args.answer_seconds, args.accuracy)
+    virtual_seconds, real_seconds = run_session(app, subject, args.speed)
+
+    print(f"Ran {app_module.MAX_CYCLES} test intervals ({virtual_seconds:.0f} s of protocol time) in {real_seconds:.2f} s")
+    for cycle, (given, correct) in sorted(subject.answers.items()):
+        print(f"  Test {cycle}: {correct} of {given} answers correct")
+    print(f"Logs in {log_dir}")
+
+
+if __name__ == "__main__":
+    main()
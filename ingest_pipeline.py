@@ -0,0 +1,142 @@
+import collections
+import threading
+import time
+
+import numpy as np
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+LATENCY_WINDOW = 4096
+
+
+class PacketQueue:
+    # Bounded hand-off between the receive and processing stages. When full, "block" makes the
+    # producer wait, "drop_oldest" evicts the oldest queued packet and "drop_newest" discards
+    # the incoming one. Items are tuples ending in their sample time, queued in that order, which
+    # drain(before_ns=...) relies on.
+    def __init__(self, maxsize, overflow_policy="drop_oldest"):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}, got {overflow_policy!r}")
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.max_depth = 0
+        self.in_flight = 0
+        self.in_flight_first_ns = None
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                if self.overflow_policy == "block":
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.condition.wait()
+                elif self.overflow_policy == "drop_oldest":
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return False
+            if self.closed:
+                return False
+            self.items.append(item)
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+            self.condition.notify_all()
+            return True
+
+    def get_batch(self, max_items, timeout=None):
+        # Returns up to max_items packets, waiting only while the queue is empty. A closed queue
+        # returns nothing, so the consumer can exit without working through a backlog.
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if self.closed:
+                return []
+            batch = []
+            while self.items and len(batch) < max_items:
+                batch.append(self.items.popleft())
+            self.in_flight = len(batch)
+            self.in_flight_first_ns = batch[0][-1] if batch else None
+            if batch:
+                self.condition.notify_all()
+            return batch
+
+    def task_done(self):
+        with self.condition:
+            self.in_flight = 0
+            self.in_flight_first_ns = None
+            self.condition.notify_all()
+
+    def pending_before(self, before_ns):
+        # Queued or in-flight packets stamped before before_ns
+        with self.condition:
+            count = self.in_flight if self.in_flight and self.in_flight_first_ns < before_ns else 0
+            for item in self.items:
+                if item[-1] >= before_ns:
+                    break
+                count += 1
+            return count
+
+    def drain(self, timeout=None, before_ns=None):
+        # Wait until every queued packet (or, with before_ns, every packet stamped before it) has been
+        # handed out and processed; packets queued after those don't hold the caller up
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not self.closed:
+                if before_ns is None:
+                    pending = self.items or self.in_flight
+                else:
+                    pending = ((self.items and self.items[0][-1] < before_ns)
+                               or (self.in_flight and self.in_flight_first_ns < before_ns))
+                if not pending:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StageLatency:
+    # Per-stage latency in nanoseconds: running count/mean/max plus a window of recent samples for percentiles
+    def __init__(self, window=LATENCY_WINDOW):
+        self.recent = np.zeros(window, dtype=np.int64)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, latency_ns):
+        self.recent[self.count % len(self.recent)] = latency_ns
+        self.count += 1
+        self.total_ns += latency_ns
+        if latency_ns > self.max_ns:
+            self.max_ns = latency_ns
+
+    def summary(self):
+        if self.count == 0:
+            return {"count": 0}
+        recent = self.recent[:min(self.count, len(self.recent))]
+        p50, p99 = np.percentile(recent, [50, 99])
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000,
+            "p50_us": p50 / 1000,
+            "p99_us": p99 / 1000,
+            "max_us": self.max_ns / 1000,
+        }
+
+    def describe(self):
+        summary = self.summary()
+        if summary["count"] == 0:
+            return "no packets"
+        return f"p50 {summary['p50_us']:.0f} us, p99 {summary['p99_us']:.0f} us, max {summary['max_us']:.0f} us"
@@ -0,0 +1,143 @@
+import numpy as np
+
+NUM_BANDS = 5
+# Named parts of an interval, as fractions of its scheduled duration
+SEGMENTS = {"middle_third": (1 / 3, 2 / 3)}
+
+
+class RunningStats:
+    # Streaming count/sum/mean/variance (Welford)/min/max over scalars or fixed-shape vectors.
+    # The average is sum / count, so an infinite sample makes it infinite just like a plain mean would.
+    # Counts are kept per element so samples can be masked out element by element (see add_batch).
+    def __init__(self, shape=()):
+        self.counts = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    @property
+    def count(self):
+        # Samples seen by the best-covered element
+        return int(self.counts.max()) if self.counts.size else 0
+
+    def add(self, value):
+        self.add_batch(np.asarray(value)[np.newaxis])
+
+    def add_batch(self, values, valid=None):
+        # Merges a block of samples (first axis) with Chan et al.'s parallel update, so a
+        # micro-batch costs a handful of array operations however many packets it holds.
+        # valid (broadcastable to values) leaves out samples per element, e.g. bad channels.
+        if len(values) == 0:
+            return
+        if valid is None:
+            k = len(values)
+            batch_total = values.sum(axis=0)
+            batch_mean = batch_total / k
+            batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+            batch_min = values.min(axis=0)
+            batch_max = values.max(axis=0)
+        else:
+            valid = np.broadcast_to(valid, values.shape)
+            k = valid.sum(axis=0)
+            batch_total = np.where(valid, values, 0.0).sum(axis=0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                batch_mean = np.where(k > 0, batch_total / k, 0.0)
+            batch_m2 = np.where(valid, values - batch_mean, 0.0)
+            batch_m2 = (batch_m2 ** 2).sum(axis=0)
+            batch_min = np.where(valid, values, np.inf).min(axis=0)
+            batch_max = np.where(valid, values, -np.inf).max(axis=0)
+        n = self.counts + k
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, k / np.maximum(n, 1), 0.0)
+            delta = np.where(k > 0, batch_mean - self.mean, 0.0)
+        self.mean += delta * weight
+        self.m2 += batch_m2 + delta ** 2 * (self.counts * weight)
+        self.total += batch_total
+        np.minimum(self.min, batch_min, out=self.min)
+        np.maximum(self.max, batch_max, out=self.max)
+        self.counts = n
+
+    @property
+    def average(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.counts > 0, self.total / np.maximum(self.counts, 1), np.nan)
+
+    @property
+    def variance(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.counts > 0, self.m2 / np.maximum(self.counts, 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class SegmentStats:
+    def __init__(self):
+        self.band_powers = RunningStats(NUM_BANDS)
+        self.theta_alpha_ratio = RunningStats()
+        self.per_channel_theta_alpha_ratio = None
+        self.features = None
+
+    @property
+    def count(self):
+        return self.band_powers.count
+
+    def add_batch(self, channel_averages, theta_alpha_ratios, per_channel_theta_alpha_ratios, channel_valid, features):
+        # Rows where no channel was valid have NaN averages and are left out entirely; per-channel
+        # statistics leave out each channel's invalid samples
+        any_valid = channel_valid.any(axis=1)
+        if any_valid.all():
+            self.band_powers.add_batch(channel_averages)
+            self.theta_alpha_ratio.add_batch(theta_alpha_ratios)
+        else:
+            self.band_powers.add_batch(channel_averages, any_valid[:, np.newaxis])
+            self.theta_alpha_ratio.add_batch(theta_alpha_ratios, any_valid)
+        if self.per_channel_theta_alpha_ratio is None:
+            self.per_channel_theta_alpha_ratio = RunningStats(per_channel_theta_alpha_ratios.shape[1])
+        if channel_valid.all():
+            self.per_channel_theta_alpha_ratio.add_batch(per_channel_theta_alpha_ratios)
+        else:
+            self.per_channel_theta_alpha_ratio.add_batch(per_channel_theta_alpha_ratios, channel_valid)
+        # Derived features leave out undefined values (NaN or infinite, e.g. a zero denominator)
+        if self.features is None:
+            self.features = RunningStats(features.shape[1])
+        finite = np.isfinite(features)
+        self.features.add_batch(features, None if finite.all() else finite)
+
+
+class IntervalStats:
+    # Updated as packets arrive (once per processing micro-batch) so the interval summary is
+    # ready the moment the interval ends. Samples are assigned to segments by their offset
+    # from the interval start.
+    def __init__(self, start_ns, duration_seconds, segments=SEGMENTS):
+        self.start_ns = start_ns
+        self.duration_ns = int(duration_seconds * 1e9)
+        self.whole = SegmentStats()
+        self.segment_bounds = {name: (int(start * self.duration_ns), int(end * self.duration_ns))
+                               for name, (start, end) in segments.items()}
+        self.segments = {name: SegmentStats() for name in segments}
+
+    def add_batch(self, timestamps_ns, channel_averages, theta_alpha_ratios, per_channel_theta_alpha_ratios, channel_valid,
+                  features):
+        # Rows arrive in timestamp order, so each segment's share of the batch is a contiguous slice
+        self.whole.add_batch(channel_averages, theta_alpha_ratios, per_channel_theta_alpha_ratios, channel_valid, features)
+        offsets = timestamps_ns - self.start_ns
+        for name, (start, end) in self.segment_bounds.items():
+            first, last = np.searchsorted(offsets, (start, end))
+            if last > first:
+                self.segments[name].add_batch(channel_averages[first:last], theta_alpha_ratios[first:last],
+                                              per_channel_theta_alpha_ratios[first:last], channel_valid[first:last],
+                                              features[first:last])
+
+    def add_rows(self, samples, start, end):
+        # Folds rows [start, end) of a SampleStore into the statistics; their features must already be computed
+        self.add_batch(samples.timestamps_ns[start:end], samples.channel_averages[start:end],
+                       samples.theta_alpha_ratios[start:end], samples.per_channel_theta_alpha_ratios[start:end],
+                       samples.channel_valid[start:end], samples.feature_values[start:end])
+
+    @property
+    def count(self):
+        return self.whole.count
@@ -0,0 +1,118 @@
+import time
+
+import numpy as np
+
+from graph_renderer import downsample_minmax
+from sample_store import ALPHA, THETA
+
+WINDOW_SECONDS = 10 # how much recent signal the panel shows
+REFRESH_MS = 100 # redraw period, independent of how fast packets arrive
+MAX_POINTS = 400 # points drawn per line, however many samples fall in the window
+Y_HEADROOM = 1.25 # y limits are set this far above the visible maximum when they have to change
+
+
+class LivePlot:
+    # Scrolling theta/alpha and theta/alpha ratio panel for a Tk window. A root.after timer redraws
+    # at a fixed rate; each refresh slices the last WINDOW_SECONDS out of the listener's sample
+    # store, downsamples it to MAX_POINTS and blits only the lines over a cached background. The
+    # axes are only fully redrawn when the y limits have to change or the widget is resized.
+    def __init__(self, master, get_samples, window_seconds=WINDOW_SECONDS, refresh_ms=REFRESH_MS,
+                 max_points=MAX_POINTS, figsize=(6, 2.6)):
+        self.master = master
+        self.get_samples = get_samples
+        self.window_seconds = window_seconds
+        self.refresh_ms = refresh_ms
+        self.max_points = max_points
+        self.after_id = None
+        self.background = None
+        self.last_drawn = None
+
+        # matplotlib is imported here, once the panel is actually shown, to keep it out of startup
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=figsize)
+        self.band_ax, self.ratio_ax = self.figure.subplots(2, 1, sharex=True)
+        self.theta_line, = self.band_ax.plot([], [], color="blue", label="Theta", animated=True)
+        self.alpha_line, = self.band_ax.plot([], [], color="green", label="Alpha", animated=True)
+        self.ratio_line, = self.ratio_ax.plot([], [], color="red", label="Theta/Alpha", animated=True)
+        self.band_ax.set_ylabel("Power", fontsize=8)
+        self.ratio_ax.set_ylabel("Ratio", fontsize=8)
+        self.ratio_ax.set_xlabel("Seconds", fontsize=8)
+        for ax in (self.band_ax, self.ratio_ax):
+            ax.set_xlim(-window_seconds, 0)
+            ax.set_ylim(0, 1)
+            ax.tick_params(labelsize=7)
+            ax.legend(handles=ax.get_lines(), loc="upper left", fontsize=7)
+            ax.grid(True)
+        self.figure.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.widget = self.canvas.get_tk_widget()
+
+    def on_draw(self, event):
+        # Every full draw (first show, resize, new y limits) refreshes the background the lines are blitted onto
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.master.after(self.refresh_ms, self.refresh)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.master.after_cancel(self.after_id)
+            self.after_id = None
+
+    def refresh(self):
+        self.after_id = self.master.after(self.refresh_ms, self.refresh)
+        self.update_lines(time.monotonic_ns())
+        if self.background is None:
+            return
+        if self.rescale():
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_lines()
+            self.canvas.blit(self.figure.bbox)
+
+    def update_lines(self, now_ns):
+        samples = self.get_samples()
+        # num_samples is published after a row is complete, so rows below it are safe to read while
+        # the processing thread appends; a grown buffer still holds copies of them
+        num_samples = samples.num_samples
+        if num_samples == 0:
+            seconds = theta = alpha = ratios = np.empty(0)
+        else:
+            timestamps_ns = samples.timestamps_ns[:num_samples]
+            first = np.searchsorted(timestamps_ns, now_ns - int(self.window_seconds * 1e9))
+            seconds = (timestamps_ns[first:] - now_ns) / 1e9
+            averages = samples.channel_averages[first:num_samples]
+            theta = averages[:, THETA]
+            alpha = averages[:, ALPHA]
+            ratios = samples.theta_alpha_ratios[first:num_samples]
+        self.theta_line.set_data(*downsample_minmax(seconds, theta, self.max_points))
+        self.alpha_line.set_data(*downsample_minmax(seconds, alpha, self.max_points))
+        self.ratio_line.set_data(*downsample_minmax(seconds, ratios, self.max_points))
+
+    def rescale(self):
+        # Fixed y limits keep the cached background valid; they only move when the visible data
+        # leaves them or shrinks to a small fraction of them
+        changed = False
+        for ax in (self.band_ax, self.ratio_ax):
+            values = [line.get_ydata() for line in ax.get_lines()]
+            values = np.concatenate(values) if values else np.empty(0)
+            values = values[np.isfinite(values)]
+            if len(values) == 0:
+                continue
+            low, high = min(values.min(), 0), values.max()
+            bottom, top = ax.get_ylim()
+            if high > top or low < bottom or high < top / (Y_HEADROOM * 4):
+                ax.set_ylim(low * Y_HEADROOM, max(high * Y_HEADROOM, 1e-9))
+                changed = True
+        return changed
+
+    def draw_lines(self):
+        for line in (self.theta_line, self.alpha_line, self.ratio_line):
+            line.axes.draw_artist(line)
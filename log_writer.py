@@ -0,0 +1,165 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from session_format import SessionWriter
+
+QUEUE_SIZE = 10000
+FLUSH_INTERVAL_MS = 1000
+FLUSH_EVERY_RECORDS = 500
+
+_STOP = object()
+
+
+def _to_json(value):
+    # Band power arrays from the fast decoder are serialized as nested lists
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DetailedLogWriter(threading.Thread):
+    # Serializes and writes log records off the receive thread. Records are batched
+    # into a single write and flushed every flush_every_records records or
+    # flush_interval_ms milliseconds, whichever comes first, and on flush()/close().
+    # If session_path is set, records are also appended to a binary session file.
+    def __init__(self, path, queue_size=QUEUE_SIZE, flush_interval_ms=FLUSH_INTERVAL_MS,
+                 flush_every_records=FLUSH_EVERY_RECORDS, fsync=False, session_path=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.session_path = session_path
+        self.session_writer = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_every_records = flush_every_records
+        self.fsync = fsync
+        self.records_written = 0
+        self.bytes_written = 0
+        self.dropped_records = 0
+        self.flushes = 0
+        self.error = None
+
+    def write(self, record, timestamp_ns=None):
+        # Never blocks the caller; a full queue means the disk can't keep up, so drop and count
+        try:
+            self.queue.put_nowait((record, timestamp_ns))
+            return True
+        except queue.Full:
+            self.dropped_records += 1
+            return False
+
+    def flush(self, wait=False, timeout=None):
+        request = _FlushRequest()
+        if not self.is_alive():
+            request.done.set()
+            return request
+        self.queue.put(request)
+        if wait:
+            request.done.wait(timeout)
+        return request
+
+    def close(self, wait=True, timeout=None):
+        if self.is_alive():
+            self.queue.put(_STOP)
+            if wait:
+                self.join(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "records_written": self.records_written,
+            "bytes_written": self.bytes_written,
+            "dropped_records": self.dropped_records,
+            "flushes": self.flushes,
+            "session_rows": self.session_writer.num_rows if self.session_writer else 0,
+        }
+
+    def run(self):
+        try:
+            with open(self.path, "w") as log_file:
+                pending = []
+                next_flush = time.monotonic() + self.flush_interval
+                running = True
+                while running:
+                    try:
+                        item = self.queue.get(timeout=max(0, next_flush - time.monotonic()))
+                    except queue.Empty:
+                        item = None
+
+                    flush_request = None
+                    while item is not None:
+                        if item is _STOP:
+                            running = False
+                            break
+                        if isinstance(item, _FlushRequest):
+                            flush_request = item
+                            break
+                        pending.append(item)
+                        if len(pending) >= self.flush_every_records:
+                            break
+                        try:
+                            item = self.queue.get_nowait()
+                        except queue.Empty:
+                            item = None
+
+                    if (flush_request or not running
+                            or len(pending) >= self.flush_every_records
+                            or (pending and time.monotonic() >= next_flush)):
+                        self._write_batch(log_file, pending)
+                        pending = []
+                        next_flush = time.monotonic() + self.flush_interval
+                    elif not pending:
+                        next_flush = time.monotonic() + self.flush_interval
+                    if flush_request:
+                        flush_request.done.set()
+        except OSError as e:
+            # Opening the log, or closing it with unflushed data after a failed flush
+            self.error = e
+            print(f"ERROR: Failed to write detailed log {self.path}: {e}")
+        if self.session_writer:
+            self.session_writer.close()
+        print(f"Detailed log: {self.records_written} records, {self.bytes_written} bytes written, {self.dropped_records} dropped")
+
+    def _write_batch(self, log_file, records):
+        if records:
+            data = "".join(json.dumps(record, default=_to_json) + "\n" for record, _ in records)
+            try:
+                log_file.write(data)
+            except OSError as e:
+                self.error = e
+                print(f"ERROR: Failed to write detailed log {self.path}: {e}")
+                return
+            self.records_written += len(records)
+            self.bytes_written += len(data)  # json.dumps output is ASCII
+            if self.session_path:
+                self._write_session(records)
+        try:
+            log_file.flush()
+            if self.fsync:
+                os.fsync(log_file.fileno())
+        except OSError as e:
+            # e.g. disk full or removed media; the writer keeps running so flush() and close() still return
+            self.error = e
+            print(f"ERROR: Failed to flush detailed log {self.path}: {e}")
+            return
+        self.flushes += 1
+
+    def _write_session(self, records):
+        try:
+            for record, timestamp_ns in records:
+                if "band_power_data" not in record:
+                    # Event records (e.g. track start/stop) only go to the text log
+                    continue
+                if self.session_writer is None:
+                    self.session_writer = SessionWriter(self.session_path, len(record["band_power_data"]))
+                self.session_writer.append_record(record, timestamp_ns)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: Failed to write session file {self.session_path}: {e}")
+            self.session_path = None
@@ -0,0 +1,239 @@
+import json
+import os
+import struct
+import sys
+import wave
+
+INDEX_VERSION = 1
+
+# MPEG audio frame header tables, indexed by the header's version, layer, bitrate and sample rate fields
+_MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+_MPEG_LAYERS = {1: 3, 2: 2, 3: 1}
+_MPEG_BITRATES_KBPS = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MPEG_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+_MP3_SCAN_BYTES = 256 * 1024 # how far into the file to look for the first frame after any ID3 tag
+
+
+def _mpeg_frame(header):
+    # Returns (bitrate_bps, sample_rate, samples_per_frame, frame_bytes, side_info_bytes) or None
+    if len(header) < 4:
+        return None
+    bits = int.from_bytes(header[:4], "big")
+    if bits >> 21 != 0x7FF:
+        return None
+    version = _MPEG_VERSIONS.get((bits >> 19) & 3)
+    layer = _MPEG_LAYERS.get((bits >> 17) & 3)
+    bitrate_index = (bits >> 12) & 15
+    sample_rate_index = (bits >> 10) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _MPEG_BITRATES_KBPS[(1, layer) if version == 1 else (2, 1 if layer == 1 else 2)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (bits >> 9) & 1
+    mono = (bits >> 6) & 3 == 3
+    if layer == 1:
+        samples_per_frame = 384
+        frame_bytes = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 576 if layer == 3 and version != 1 else 1152
+        frame_bytes = samples_per_frame // 8 * bitrate // sample_rate + padding
+    if version == 1:
+        side_info_bytes = 17 if mono else 32
+    else:
+        side_info_bytes = 9 if mono else 17
+    return bitrate, sample_rate, samples_per_frame, frame_bytes, side_info_bytes
+
+
+def _find_first_frame(data):
+    position = data.find(b"\xff")
+    while 0 <= position <= len(data) - 4:
+        frame = _mpeg_frame(data[position:position + 4])
+        if frame is not None:
+            # Require the next frame to start where this one ends, so stray 0xFF bytes aren't taken for a header
+            next_position = position + frame[3]
+            if next_position + 4 > len(data) or _mpeg_frame(data[next_position:next_position + 4]) is not None:
+                return position, frame
+        position = data.find(b"\xff", position + 1)
+    return None
+
+
+def mp3_duration(path):
+    # Duration from the headers alone: the Xing/Info or VBRI frame count when the encoder wrote one,
+    # otherwise the audio size divided by the first frame's bitrate (exact for constant bitrate)
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        data = f.read(_MP3_SCAN_BYTES)
+        offset = 0
+        if data[:3] == b"ID3" and len(data) >= 10:
+            tag_size = ((data[6] & 0x7F) << 21) | ((data[7] & 0x7F) << 14) | ((data[8] & 0x7F) << 7) | (data[9] & 0x7F)
+            offset = 10 + tag_size + (10 if data[5] & 0x10 else 0)
+            f.seek(offset)
+            data = f.read(_MP3_SCAN_BYTES)
+        f.seek(max(file_size - 128, 0))
+        has_id3v1 = f.read(3) == b"TAG"
+
+    first_frame = _find_first_frame(data)
+    if first_frame is None:
+        return None
+    position, frame = first_frame
+    bitrate, sample_rate, samples_per_frame, frame_bytes, side_info_bytes = frame
+
+    xing = position + 4 + side_info_bytes
+    if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+        flags, = struct.unpack(">I", data[xing + 4:xing + 8])
+        if flags & 1:
+            num_frames, = struct.unpack(">I", data[xing + 8:xing + 12])
+            return num_frames * samples_per_frame / sample_rate
+    vbri = position + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI" and len(data) >= vbri + 18:
+        num_frames, = struct.unpack(">I", data[vbri + 14:vbri + 18])
+        return num_frames * samples_per_frame / sample_rate
+
+    audio_bytes = file_size - offset - position - (128 if has_id3v1 else 0)
+    return audio_bytes * 8 / bitrate
+
+
+def ogg_duration(path):
+    # Vorbis and Opus streams: the last page's granule position is the total sample count
+    with open(path, "rb") as f:
+        first_page = f.read(512)
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        f.seek(max(file_size - 65536, 0))
+        tail = f.read()
+    if first_page[:4] != b"OggS":
+        return None
+    header = first_page[28:]
+    if header[:7] == b"\x01vorbis":
+        sample_rate, = struct.unpack("<I", header[12:16])
+        pre_skip = 0
+    elif header[:8] == b"OpusHead":
+        sample_rate = 48000
+        pre_skip, = struct.unpack("<H", header[10:12])
+    else:
+        return None
+    last_page = tail.rfind(b"OggS")
+    if last_page < 0 or last_page + 14 > len(tail) or not sample_rate:
+        return None
+    granule, = struct.unpack("<q", tail[last_page + 6:last_page + 14])
+    return max(granule - pre_skip, 0) / sample_rate
+
+
+def wav_duration(path):
+    try:
+        with wave.open(path, "rb") as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+
+_HEADER_PARSERS = {".mp3": mp3_duration, ".ogg": ogg_duration, ".opus": ogg_duration, ".wav": wav_duration}
+
+
+def decoded_duration(path):
+    # Last resort for formats the header parsers don't cover; only ever runs once per file since
+    # the result goes into the index
+    from pygame import mixer
+
+    if not mixer.get_init():
+        mixer.init()
+    return mixer.Sound(path).get_length()
+
+
+def audio_duration(path):
+    parser = _HEADER_PARSERS.get(os.path.splitext(path)[1].lower())
+    duration = None
+    if parser is not None:
+        try:
+            duration = parser(path)
+        except (OSError, struct.error, ValueError):
+            duration = None
+    if duration is None:
+        duration = decoded_duration(path)
+    return duration
+
+
+class MusicLibrary:
+    # Index of every track under music_folder/<genre>/, saved as JSON so later runs only re-read
+    # files whose size or modification time changed. Track selection and scheduling read
+    # durations from here instead of decoding audio.
+    def __init__(self, music_folder, index_path):
+        self.music_folder = music_folder
+        self.index_path = index_path
+        self.tracks = {}
+
+    def load(self):
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+            if index.get("version") == INDEX_VERSION and index.get("music_folder") == os.path.abspath(self.music_folder):
+                self.tracks = index["tracks"]
+        except (OSError, ValueError, KeyError):
+            self.tracks = {}
+        return self
+
+    def save(self):
+        index = {"version": INDEX_VERSION, "music_folder": os.path.abspath(self.music_folder), "tracks": self.tracks}
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as index_file:
+            json.dump(index, index_file, indent=1)
+        os.replace(temp_path, self.index_path)
+
+    def refresh(self):
+        # Stat every file and only re-read the headers of new or changed ones; returns the number of
+        # tracks added, updated or removed and saves the index if there were any
+        tracks = {}
+        changed = 0
+        for genre in sorted(os.listdir(self.music_folder)):
+            genre_folder = os.path.join(self.music_folder, genre)
+            if genre.startswith(".") or not os.path.isdir(genre_folder):
+                continue
+            for entry in sorted(os.scandir(genre_folder), key=lambda entry: entry.name):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                path = os.path.join(genre, entry.name)
+                track = self.tracks.get(path)
+                if track is None or track["size"] != stat.st_size or track["mtime_ns"] != stat.st_mtime_ns:
+                    try:
+                        duration = audio_duration(entry.path)
+                    except Exception as e:
+                        print(f"WARNING: Skipping {entry.path}, could not read its duration: {e!r}")
+                        continue
+                    track = {"genre": genre, "duration": duration, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+                    changed += 1
+                tracks[path] = track
+        changed += len(self.tracks.keys() - tracks.keys())
+        self.tracks = tracks
+        if changed:
+            self.save()
+        return changed
+
+    def genres(self):
+        return sorted({track["genre"] for track in self.tracks.values()})
+
+    def songs(self, genre):
+        # (full path, duration in seconds) for every track of the genre
+        return [(os.path.join(self.music_folder, path), track["duration"])
+                for path, track in self.tracks.items() if track["genre"] == genre]
+
+
+def main():
+    music_folder = sys.argv[1] if len(sys.argv) > 1 else "music"
+    index_path = sys.argv[2] if len(sys.argv) > 2 else "music_library.json"
+    library = MusicLibrary(music_folder, index_path).load()
+    changed = library.refresh()
+    for genre in library.genres():
+        songs = library.songs(genre)
+        print(f"{genre}: {len(songs)} tracks, {sum(duration for _, duration in songs) / 60:.1f} minutes")
+    print(f"{len(library.tracks)} tracks indexed, {changed} changed")
+
+
+if __name__ == "__main__":
+    main()
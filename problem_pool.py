@@ -0,0 +1,78 @@
+import queue
+import random
+import threading
+
+POOL_SIZE = 20
+
+# terms: number of distinct exponents per polynomial; exponents and coefficients are inclusive ranges.
+# "normal" matches the original generator.
+DIFFICULTIES = {
+    "easy": {"terms": 2, "exponents": (0, 3), "coefficients": (1, 5)},
+    "normal": {"terms": 3, "exponents": (-1, 5), "coefficients": (-9, 9)},
+    "hard": {"terms": 4, "exponents": (-3, 7), "coefficients": (-15, 15)},
+}
+
+
+class Problem:
+    # A derivative question with everything the UI and the answer check need, computed up front.
+    # coefficients and derivative_coefficients map exponent -> coefficient with zero terms left out.
+    def __init__(self, coefficients, exponents):
+        # sympy is imported here rather than at the top so it loads on the pool's worker thread
+        import sympy as sp
+
+        x = sp.Symbol('x')
+        self.coefficients = {}
+        for coeff, exp in zip(coefficients, exponents):
+            if coeff:
+                self.coefficients[exp] = self.coefficients.get(exp, 0) + coeff
+        self.derivative_coefficients = {exp - 1: coeff * exp for exp, coeff in self.coefficients.items() if exp != 0}
+        self.polynomial = sum(coeff * x ** exp for coeff, exp in zip(coefficients, exponents))
+        self.derivative = sp.diff(self.polynomial, x)
+        self.display = str(sp.expand(self.polynomial)).replace('**', '^').replace('*', '')
+
+
+def generate_problem(difficulty="normal", rng=random):
+    settings = DIFFICULTIES[difficulty]
+    low, high = settings["coefficients"]
+    coefficients = [rng.randint(low, high) for _ in range(settings["terms"])]
+    exponents = set()
+    while len(exponents) < settings["terms"]:
+        exponents.add(rng.randint(*settings["exponents"]))
+    return Problem(coefficients, list(exponents))
+
+
+class ProblemPool:
+    # Keeps up to size problems ready, generated by a background thread, so taking the next
+    # question costs a queue pop. Generating the first problems also pays sympy's first-call
+    # cost before the test starts.
+    def __init__(self, difficulty="normal", size=POOL_SIZE):
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"difficulty must be one of {tuple(DIFFICULTIES)}, got {difficulty!r}")
+        self.difficulty = difficulty
+        self.problems = queue.Queue(maxsize=size)
+        self.stop_event = threading.Event()
+        self.worker = threading.Thread(target=self.fill, name="problem-pool", daemon=True)
+
+    def start(self):
+        self.worker.start()
+        return self
+
+    def fill(self):
+        while not self.stop_event.is_set():
+            problem = generate_problem(self.difficulty)
+            while not self.stop_event.is_set():
+                try:
+                    self.problems.put(problem, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+
+    def next_problem(self):
+        try:
+            return self.problems.get_nowait()
+        except queue.Empty:
+            # The worker fell behind (or hasn't started); generate on the caller's thread rather than wait
+            return generate_problem(self.difficulty)
+
+    def close(self):
+        self.stop_event.set()
@@ -0,0 +1,167 @@
+import numpy as np
+
+from features import FEATURES, FeatureExtractor
+
+NUM_BANDS = 5  # [delta, theta, alpha, beta, gamma]
+THETA = 1
+ALPHA = 2
+INITIAL_CAPACITY = 4096
+
+
+def channel_validity(bands):
+    # (..., channels, bands) -> (..., channels) bool: every band finite and alpha above zero
+    with np.errstate(invalid="ignore"):
+        return np.isfinite(bands).all(axis=-1) & (bands[..., ALPHA] > 0)
+
+
+def valid_channel_averages(bands, valid=None):
+    # Band powers averaged over the valid channels of each row of a (rows, channels, bands) array;
+    # NaN for rows without any valid channel. Matches SampleStore.channel_averages.
+    if valid is None:
+        valid = channel_validity(bands)
+    num_valid = valid.sum(axis=1)[:, np.newaxis]
+    totals = np.where(valid[..., np.newaxis], bands, 0).sum(axis=1, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(num_valid > 0, totals / np.maximum(num_valid, 1), np.nan)
+
+
+class SampleStore:
+    def __init__(self, initial_capacity=INITIAL_CAPACITY, features=FEATURES):
+        self.capacity = initial_capacity
+        self.feature_registry = features
+        self.feature_names = list(features)
+        self.num_channels = 0
+        self.num_samples = 0
+        # Columns are allocated on the first packet, once the channel count is known
+        self.bands = None
+        self.timestamps_ns = None
+        self.channel_averages = None
+        self.theta_alpha_ratios = None
+        self.per_channel_theta_alpha_ratios = None
+        # True where a channel's sample is usable: every band finite and alpha above zero
+        self.channel_valid = None
+        # Derived features (see features.py), one column per registry entry. They are computed a
+        # block of rows at a time by update_features(), so rows from num_features on aren't filled yet.
+        self.feature_values = None
+        self.extractor = None
+        self.num_features = 0
+
+    def _allocate(self, num_channels):
+        self.num_channels = num_channels
+        self.bands = np.empty((self.capacity, num_channels, NUM_BANDS), dtype=np.float64)
+        self.timestamps_ns = np.empty(self.capacity, dtype=np.int64)
+        self.channel_averages = np.empty((self.capacity, NUM_BANDS), dtype=np.float64)
+        self.theta_alpha_ratios = np.empty(self.capacity, dtype=np.float64)
+        self.per_channel_theta_alpha_ratios = np.empty((self.capacity, num_channels), dtype=np.float64)
+        self.channel_valid = np.empty((self.capacity, num_channels), dtype=bool)
+        self._finite = np.empty((num_channels, NUM_BANDS), dtype=bool)
+        self.extractor = FeatureExtractor(num_channels, self.feature_registry)
+        self.feature_values = np.empty((self.capacity, len(self.extractor)), dtype=np.float64)
+
+    def _grow(self):
+        # Readers may still hold views of the old buffers; those stay valid because
+        # the new buffers are fresh copies rather than resized in place.
+        self.capacity *= 2
+        for name in ("bands", "timestamps_ns", "channel_averages", "theta_alpha_ratios", "per_channel_theta_alpha_ratios",
+                     "channel_valid", "feature_values"):
+            old = getattr(self, name)
+            new = np.empty((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.num_samples] = old[:self.num_samples]
+            setattr(self, name, new)
+
+    def append(self, band_power_data, timestamp_ns):
+        bands = np.asarray(band_power_data, dtype=np.float64)
+        if bands.ndim != 2 or bands.shape[1] != NUM_BANDS:
+            raise ValueError(f"expected (channels x {NUM_BANDS}) band powers, got shape {bands.shape}")
+        if self.bands is None:
+            self._allocate(bands.shape[0])
+        elif bands.shape[0] != self.num_channels:
+            raise ValueError(f"expected {self.num_channels} channels, got {bands.shape[0]}")
+        if self.num_samples == self.capacity:
+            self._grow()
+
+        i = self.num_samples
+        self.bands[i] = bands
+        self.timestamps_ns[i] = timestamp_ns
+        ratios = self.per_channel_theta_alpha_ratios[i]
+        averages = self.channel_averages[i]
+        alpha = bands[:, ALPHA]
+        if alpha.min() > 0 and np.isfinite(bands.sum()):
+            # Every channel usable (the usual case): no masking needed
+            np.divide(bands[:, THETA], alpha, out=ratios)
+            self.channel_valid[i] = True
+            np.mean(bands, axis=0, out=averages)
+        else:
+            valid = self.channel_valid[i]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.divide(bands[:, THETA], alpha, out=ratios)
+                np.isfinite(bands, out=self._finite).all(axis=1, out=valid)
+                valid &= alpha > 0
+            # Averages leave out invalid channels (e.g. a disconnected electrode reporting zeros)
+            # and are NaN if no channel is valid
+            num_valid = np.count_nonzero(valid)
+            if num_valid:
+                np.sum(bands[valid], axis=0, out=averages)
+                averages /= num_valid
+            else:
+                averages.fill(np.nan)
+        ratio = averages[THETA] / averages[ALPHA] if averages[ALPHA] != 0 else float('inf')
+        self.theta_alpha_ratios[i] = ratio
+        # Publish the sample only once every column has been written
+        self.num_samples = i + 1
+        return i
+
+    def update_features(self):
+        # One vectorized pass over every row appended since the last call (a processing micro-batch)
+        start, end = self.num_features, self.num_samples
+        if end > start:
+            self.extractor.compute(self.bands[start:end], self.channel_averages[start:end],
+                                   self.channel_valid[start:end], out=self.feature_values[start:end])
+            self.num_features = end
+        return end - start
+
+    def _view(self, column, *shape):
+        if column is None:
+            return np.empty((0,) + shape, dtype=np.float64)
+        return column[:self.num_samples]
+
+    @property
+    def averages(self):
+        return self._view(self.channel_averages, NUM_BANDS)
+
+    @property
+    def theta(self):
+        return self.averages[:, THETA]
+
+    @property
+    def alpha(self):
+        return self.averages[:, ALPHA]
+
+    @property
+    def ratios(self):
+        return self._view(self.theta_alpha_ratios)
+
+    @property
+    def per_channel_ratios(self):
+        return self._view(self.per_channel_theta_alpha_ratios, self.num_channels)
+
+    @property
+    def features(self):
+        if self.feature_values is None:
+            return np.empty((0, len(self.feature_names)), dtype=np.float64)
+        return self.feature_values[:self.num_features]
+
+    @property
+    def valid(self):
+        if self.channel_valid is None:
+            return np.empty((0, 0), dtype=bool)
+        return self.channel_valid[:self.num_samples]
+
+    @property
+    def timestamps(self):
+        if self.timestamps_ns is None:
+            return np.empty(0, dtype=np.int64)
+        return self.timestamps_ns[:self.num_samples]
+
+    def __len__(self):
+        return self.num_samples
@@ -0,0 +1,281 @@
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Binary session file layout (little-endian):
+#   file header:  magic (8s) | version (H) | num_channels (H) | num_bands (H) | padding to 16 bytes
+#   chunk:        b"CHNK" | num_rows (I)
+#                 for each context column: new dictionary entries (I count, then I length + JSON bytes each)
+#                 padding to 8 bytes
+#                 timestamps_ns int64[num_rows] | bands float32[num_rows * num_channels * num_bands]
+#                 num_correct int32[num_rows] | padding to 8 bytes
+#                 for each context column: uint16 codes[num_rows], padding to 8 bytes
+# Dictionaries are cumulative across chunks, so each chunk only carries the values it introduced.
+MAGIC = b"BCISESS\0"
+VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+FILE_HEADER = struct.Struct("<8sHHH")
+FILE_HEADER_SIZE = 16
+CHUNK_HEADER = struct.Struct("<4sI")
+COUNT = struct.Struct("<I")
+CONTEXT_COLUMNS = ("test_interval", "current_genre", "current_song")
+NUM_BANDS = 5
+CHUNK_ROWS = 4096
+SESSION_FILE_SUFFIX = "_session.bin"
+
+
+def _pad(offset, alignment=8):
+    return (-offset) % alignment
+
+
+class SessionWriter:
+    def __init__(self, path, num_channels, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.num_channels = num_channels
+        self.chunk_rows = chunk_rows
+        self.num_rows = 0
+        self.dictionaries = {name: {} for name in CONTEXT_COLUMNS}
+        self._new_entries = {name: [] for name in CONTEXT_COLUMNS}
+        self._timestamps = np.empty(chunk_rows, dtype="<i8")
+        self._bands = np.empty((chunk_rows, num_channels, NUM_BANDS), dtype="<f4")
+        self._num_correct = np.empty(chunk_rows, dtype="<i4")
+        self._codes = {name: np.empty(chunk_rows, dtype="<u2") for name in CONTEXT_COLUMNS}
+        self._pending = 0
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, num_channels, NUM_BANDS).ljust(FILE_HEADER_SIZE, b"\0"))
+
+    def _encode(self, name, value):
+        dictionary = self.dictionaries[name]
+        code = dictionary.get(value)
+        if code is None:
+            code = len(dictionary)
+            if code > 0xFFFF:
+                raise ValueError(f"too many distinct values for {name}")
+            dictionary[value] = code
+            self._new_entries[name].append(json.dumps(value).encode())
+        return code
+
+    def append(self, timestamp_ns, band_power_data, test_interval=None, current_genre=None, current_song=None, num_correct=0):
+        i = self._pending
+        self._bands[i] = band_power_data
+        self._timestamps[i] = timestamp_ns
+        self._num_correct[i] = num_correct
+        for name, value in zip(CONTEXT_COLUMNS, (test_interval, current_genre, current_song)):
+            self._codes[name][i] = self._encode(name, value)
+        self._pending = i + 1
+        if self._pending == self.chunk_rows:
+            self.write_chunk()
+
+    def append_record(self, record, timestamp_ns):
+        self.append(
+            timestamp_ns,
+            record["band_power_data"],
+            record.get("test_interval"),
+            record.get("current_genre"),
+            record.get("current_song"),
+            record.get("num_correct", 0),
+        )
+
+    def write_chunk(self):
+        n = self._pending
+        if n == 0:
+            return
+        parts = [CHUNK_HEADER.pack(CHUNK_MAGIC, n)]
+        for name in CONTEXT_COLUMNS:
+            entries = self._new_entries[name]
+            parts.append(COUNT.pack(len(entries)))
+            for entry in entries:
+                parts.append(COUNT.pack(len(entry)))
+                parts.append(entry)
+            entries.clear()
+        header = b"".join(parts)
+        parts = [header, b"\0" * _pad(len(header))]
+        offset = 0
+        for column in (self._timestamps[:n], self._bands[:n], self._num_correct[:n]):
+            data = column.tobytes()
+            parts.append(data)
+            offset += len(data)
+        parts.append(b"\0" * _pad(offset))
+        for name in CONTEXT_COLUMNS:
+            data = self._codes[name][:n].tobytes()
+            parts.append(data)
+            parts.append(b"\0" * _pad(len(data)))
+        self._file.write(b"".join(parts))
+        self._file.flush()
+        self.num_rows += n
+        self._pending = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.write_chunk()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SessionReader:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        buffer = memoryview(self._mmap)
+        if len(buffer) < FILE_HEADER_SIZE:
+            raise self._invalid(buffer, f"{path} is not a session file")
+        magic, version, self.num_channels, self.num_bands = FILE_HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise self._invalid(buffer, f"{path} is not a version {VERSION} session file")
+
+        self.dictionaries = {name: [] for name in CONTEXT_COLUMNS}
+        timestamps, bands, num_correct = [], [], []
+        codes = {name: [] for name in CONTEXT_COLUMNS}
+        offset = FILE_HEADER_SIZE
+        while offset + CHUNK_HEADER.size <= len(buffer):
+            chunk_magic, n = CHUNK_HEADER.unpack_from(buffer, offset)
+            if chunk_magic != CHUNK_MAGIC:
+                # Drop the views into the mapping read so far, so it can be closed
+                timestamps, bands, num_correct, codes = [], [], [], {}
+                raise self._invalid(buffer, f"{path}: corrupt chunk header at byte {offset}")
+            chunk_start = offset
+            offset += CHUNK_HEADER.size
+            new_entries = {}
+            for name in CONTEXT_COLUMNS:
+                (count,) = COUNT.unpack_from(buffer, offset)
+                offset += COUNT.size
+                entries = []
+                for _ in range(count):
+                    (length,) = COUNT.unpack_from(buffer, offset)
+                    offset += COUNT.size
+                    entries.append(json.loads(bytes(buffer[offset:offset + length])))
+                    offset += length
+                new_entries[name] = entries
+            offset += _pad(offset - chunk_start)
+
+            sizes = [n * 8, n * self.num_channels * self.num_bands * 4, n * 4]
+            columns_size = sum(sizes) + _pad(sum(sizes)) + len(CONTEXT_COLUMNS) * (n * 2 + _pad(n * 2))
+            if offset + columns_size > len(buffer):
+                # A trailing chunk cut short by a crash; everything before it is still valid
+                print(f"WARNING: {path}: ignoring truncated chunk at byte {chunk_start}")
+                break
+            for name in CONTEXT_COLUMNS:
+                self.dictionaries[name].extend(new_entries[name])
+            timestamps.append(np.frombuffer(buffer, dtype="<i8", count=n, offset=offset))
+            offset += sizes[0]
+            bands.append(np.frombuffer(buffer, dtype="<f4", count=n * self.num_channels * self.num_bands, offset=offset)
+                         .reshape(n, self.num_channels, self.num_bands))
+            offset += sizes[1]
+            num_correct.append(np.frombuffer(buffer, dtype="<i4", count=n, offset=offset))
+            offset += sizes[2]
+            offset += _pad(sum(sizes))
+            for name in CONTEXT_COLUMNS:
+                codes[name].append(np.frombuffer(buffer, dtype="<u2", count=n, offset=offset))
+                offset += n * 2 + _pad(n * 2)
+
+        # A single chunk is returned as zero-copy views of the mapping; several are concatenated
+        self.timestamps_ns = self._join(timestamps, np.empty(0, dtype="<i8"))
+        self.bands = self._join(bands, np.empty((0, self.num_channels, self.num_bands), dtype="<f4"))
+        self.num_correct = self._join(num_correct, np.empty(0, dtype="<i4"))
+        self.codes = {name: self._join(codes[name], np.empty(0, dtype="<u2")) for name in CONTEXT_COLUMNS}
+        self.num_rows = len(self.timestamps_ns)
+
+    def _invalid(self, buffer, message):
+        # Closes the mapping and the file of a file that can't be read, and returns the error to raise
+        buffer.release()
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+        return ValueError(message)
+
+    @staticmethod
+    def _join(arrays, empty):
+        if not arrays:
+            return empty
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+
+    def decoded(self, name):
+        values = np.empty(len(self.dictionaries[name]), dtype=object)
+        values[:] = self.dictionaries[name]
+        return values[self.codes[name]]
+
+    def close(self):
+        # Views handed out by the reader keep the mapping alive, so only the file is closed here
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def parse_log_timestamp(timestamp):
+    dt = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f")
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+
+
+def convert_detailed_log(log_path, session_path=None, chunk_rows=CHUNK_ROWS):
+    if session_path is None:
+        session_path = log_path.replace("_detailed_log.txt", "") + SESSION_FILE_SUFFIX
+    writer = None
+    skipped = 0
+    with open(log_path) as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+                if "event" in record:
+                    continue
+                if writer is None:
+                    writer = SessionWriter(session_path, len(record["band_power_data"]), chunk_rows)
+                writer.append_record(record, parse_log_timestamp(record["timestamp"]))
+            except (ValueError, KeyError, TypeError):
+                skipped += 1
+    if writer is None:
+        print(f"WARNING: {log_path} has no band power records")
+        return None
+    writer.close()
+    if skipped:
+        print(f"WARNING: {log_path}: skipped {skipped} unreadable lines")
+    return session_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and inspect binary session files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="convert *_detailed_log.txt files to binary session files")
+    convert_parser.add_argument("paths", nargs="+", help="detailed log files or directories containing them")
+    info_parser = subparsers.add_parser("info", help="summarize binary session files")
+    info_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        for path in args.paths:
+            log_paths = sorted(glob.glob(os.path.join(path, "*_detailed_log.txt"))) if os.path.isdir(path) else [path]
+            for log_path in log_paths:
+                session_path = convert_detailed_log(log_path)
+                if session_path:
+                    print(f"{log_path} -> {session_path} ({os.path.getsize(log_path)} -> {os.path.getsize(session_path)} bytes)")
+    else:
+        for path in args.paths:
+            start = time.perf_counter()
+            with SessionReader(path) as session:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                print(f"{path}: {session.num_rows} samples, {session.num_channels} channels, loaded in {elapsed_ms:.2f} ms")
+                for name in CONTEXT_COLUMNS:
+                    print(f"  {name}: {session.dictionaries[name]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+import numpy as np
+
+from session_format import SESSION_FILE_SUFFIX, SessionReader, parse_log_timestamp
+from stream_simulator import UDP_IP, UDP_PORT, band_power_packet, standalone_app, wait_until
+
+TARGETS = ("udp", "pipeline")
+REPLAY_LOG_FOLDER = "replay_logs"
+
+
+def load_recording(path):
+    # (timestamps_ns, bands) of every sample in a detailed log or a binary session file. Detailed logs
+    # replay the exact values received; session files hold them as float32.
+    if path.endswith(SESSION_FILE_SUFFIX):
+        with SessionReader(path) as session:
+            return session.timestamps_ns.astype(np.int64), session.bands.astype(np.float64)
+    timestamps, bands = [], []
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+                if "event" in record:
+                    continue
+                bands.append(record["band_power_data"])
+                timestamps.append(parse_log_timestamp(record["timestamp"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return np.array(timestamps, dtype=np.int64), np.array(bands, dtype=np.float64)
+
+
+def encode_packets(bands, exact=True):
+    # The datagrams as OpenBCI GUI would have sent them; 17 significant digits round-trip a float64 exactly
+    return [band_power_packet(rows.tolist(), 17 if exact else 9) for rows in bands]
+
+
+def replay_schedule(timestamps_ns, speed):
+    # Offsets from the replay start at which each packet is due, keeping the recorded spacing scaled by
+    # speed; speed 0 means as fast as possible
+    if speed == 0 or len(timestamps_ns) == 0:
+        return None
+    return ((timestamps_ns - timestamps_ns[0]) / speed).astype(np.int64)
+
+
+def replay_udp(packets, schedule, address):
+    # Sends each packet at its scheduled time; returns how late the sends were, in nanoseconds
+    lateness = np.zeros(len(packets), dtype=np.int64)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        start_ns = time.perf_counter_ns()
+        for i, packet in enumerate(packets):
+            if schedule is not None:
+                due_ns = start_ns + schedule[i]
+                wait_until(due_ns)
+                lateness[i] = time.perf_counter_ns() - due_ns
+            sock.sendto(packet, address)
+    return lateness
+
+
+def replay_pipeline(packets, timestamps_ns, schedule, log_dir):
+    # Hands the datagrams straight to a listener's processing stage, skipping the socket. Packets are
+    # queued with the real enqueue time, which the queue latency is measured from, and the recorded
+    # timing shifted to the interval start as their sample time, so interval segments, statistics and
+    # flow scores come out as in the original session whatever the replay speed.
+    from bci_flow_state_test import PIPELINE_QUEUE_SIZE, UDPListener
+    from ingest_pipeline import PacketQueue
+
+    listener = UDPListener(standalone_app())
+    # Nothing may be dropped when replaying faster than the pipeline keeps up, so the queue blocks instead
+    listener.packet_queue = PacketQueue(PIPELINE_QUEUE_SIZE, "block")
+    processing_thread = threading.Thread(target=listener.process_packets, daemon=True)
+    processing_thread.start()
+    duration_seconds = (timestamps_ns[-1] - timestamps_ns[0]) / 1e9 if len(timestamps_ns) else 0
+    interval = listener.begin_interval(duration_seconds, log_dir)
+    sample_ns = interval.start_ns + (timestamps_ns - timestamps_ns[0])
+    start_ns = time.perf_counter_ns()
+    for i, packet in enumerate(packets):
+        if schedule is not None:
+            wait_until(start_ns + schedule[i])
+        listener.packet_queue.put((packet, time.monotonic_ns(), int(sample_ns[i])))
+    listener.packet_queue.drain()
+    elapsed_seconds = (time.perf_counter_ns() - start_ns) / 1e9
+    # Every packet is processed by now, so the interval can end at its recorded length
+    listener.end_interval(int(sample_ns[-1]) + 1 if len(sample_ns) else interval.start_ns)
+    listener.finish_interval(interval)
+    listener.packet_queue.close()
+    processing_thread.join()
+    return listener, interval, elapsed_seconds
+
+
+def describe_interval(interval):
+    stats = interval.stats.whole
+    if stats.count == 0:
+        return "no samples recorded"
+    features = dict(zip(interval.samples.feature_names, np.round(stats.features.average, 4).tolist()))
+    return (f"{len(interval.samples)} samples, theta/alpha {float(stats.theta_alpha_ratio.average):.4f} "
+            f"(std {float(stats.theta_alpha_ratio.std):.4f}), features {features}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions into the UDP port or straight into the processing pipeline")
+    parser.add_argument("paths", nargs="+", help="*_detailed_log.txt or *_session.bin files, replayed one after another")
+    parser.add_argument("--speed", type=float, default=1, help="1 for real time, N for N times faster, 0 for as fast as possible")
+    parser.add_argument("--target", choices=TARGETS, default="udp",
+                        help="udp: send to a running app or bench; pipeline: process in this process, no socket")
+    parser.add_argument("--host", default=UDP_IP)
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--log-dir", default=REPLAY_LOG_FOLDER, help="where pipeline replays write their detailed logs")
+    args = parser.parse_args()
+    if args.speed < 0:
+        parser.error("--speed must be 0 or more")
+
+    for path in args.paths:
+        timestamps_ns, bands = load_recording(path)
+        if len(timestamps_ns) == 0:
+            print(f"WARNING: {path} has no band power records")
+            continue
+        packets = encode_packets(bands, exact=not path.endswith(SESSION_FILE_SUFFIX))
+        schedule = replay_schedule(timestamps_ns, args.speed)
+        recorded_seconds = (timestamps_ns[-1] - timestamps_ns[0]) / 1e9
+        print(f"{path}: {len(packets)} packets over {recorded_seconds:.1f} s, replaying "
+              f"{'as fast as possible' if schedule is None else f'at {args.speed:g}x'} to {args.target}")
+        if args.target == "udp":
+            start = time.perf_counter()
+            lateness = replay_udp(packets, schedule, (args.host, args.port))
+            elapsed = time.perf_counter() - start
+            p50, p99 = np.percentile(lateness, [50, 99]) / 1e3
+            print(f"  sent in {elapsed:.2f} s ({len(packets) / elapsed:.0f} packets/s), "
+                  f"send lateness p50 {p50:.0f} us, p99 {p99:.0f} us")
+        else:
+            log_dir = os.path.join(args.log_dir, os.path.splitext(os.path.basename(path))[0])
+            listener, interval, elapsed = replay_pipeline(packets, timestamps_ns, schedule, log_dir)
+            print(f"  processed in {elapsed:.2f} s ({len(packets) / elapsed:.0f} packets/s): {describe_interval(interval)}")
+            print(f"  processing latency {listener.processing_latency.describe()}; logs in {log_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import contextlib
+import importlib
+import os
+import sys
+import threading
+import time
+
+# Heavy modules imported in the background while the intro screens are up, so they are ready
+# (or close to it) by the time the test needs them: sympy for the problem pool and answer
+# fallback, matplotlib for the live plot, pygame for the music from interval 2.
+WARMUP_MODULES = ("sympy", "matplotlib.figure", "matplotlib.backends.backend_tkagg", "pygame.mixer")
+
+# Top-level packages grouped by the subsystem that pulls them in
+SUBSYSTEMS = {
+    "sympy": ("sympy", "mpmath"),
+    "matplotlib": ("matplotlib", "PIL", "kiwisolver", "pyparsing", "cycler", "fontTools", "dateutil", "contourpy", "packaging"),
+    "pygame": ("pygame",),
+    "numpy": ("numpy",),
+    "tkinter": ("tkinter", "_tkinter"),
+}
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+def subsystem_of(module_name, module_file=None):
+    package = module_name.partition(".")[0]
+    for subsystem, packages in SUBSYSTEMS.items():
+        if package in packages:
+            return subsystem
+    if module_file and os.path.dirname(os.path.abspath(module_file)) == APP_FOLDER:
+        return "app"
+    return "stdlib/other"
+
+
+class _TimedLoader:
+    # Wraps a module's loader to time exec_module; anything else is passed through to the real loader
+    def __init__(self, loader, profiler):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        with self._profiler.timing(module.__name__, getattr(module, "__file__", None)):
+            self._loader.exec_module(module)
+
+
+class StartupProfiler:
+    # Records the self time (excluding nested imports) of every module imported after install(),
+    # per thread, and named milestones such as the first window appearing. Only installed for
+    # --profile-startup, so normal runs import through the standard machinery untouched.
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.milestones = []
+        self.import_times = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @classmethod
+    def from_argv(cls, argv):
+        if "--profile-startup" not in argv:
+            return None
+        argv.remove("--profile-startup")
+        return cls().install()
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    @contextlib.contextmanager
+    def timing(self, module_name, module_file):
+        # Each thread keeps a stack of its in-progress imports so nested import time is charged
+        # to the nested module rather than to its importer
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            key = (subsystem_of(module_name, module_file), threading.current_thread().name)
+            with self.lock:
+                self.import_times[key] = self.import_times.get(key, 0.0) + elapsed - nested
+
+    def mark(self, name):
+        self.milestones.append((name, time.perf_counter() - self.start))
+
+    def report(self):
+        lines = ["Startup profile:"]
+        for name, seconds in self.milestones:
+            lines.append(f"  {name:<32} {seconds * 1000:8.1f} ms after start")
+        with self.lock:
+            import_times = dict(self.import_times)
+        threads = sorted({thread for _, thread in import_times}, key=lambda thread: thread != "MainThread")
+        lines.append("  import time (ms) by subsystem and importing thread:")
+        lines.append(f"    {'':<14}" + "".join(f"{thread:>14}" for thread in threads))
+        subsystems = sorted({subsystem for subsystem, _ in import_times},
+                            key=lambda subsystem: -sum(import_times.get((subsystem, thread), 0) for thread in threads))
+        for subsystem in subsystems:
+            times = [import_times.get((subsystem, thread), 0.0) * 1000 for thread in threads]
+            lines.append(f"    {subsystem:<14}" + "".join(f"{value:14.1f}" for value in times))
+        return "\n".join(lines)
+
+
+def start_warmup(modules=WARMUP_MODULES, profiler=None):
+    # Imports modules one after another on a daemon thread; a failed import is reported and skipped
+    # so the app can still surface the error where the module is actually used
+    def warm_up():
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                print(f"WARNING: Background import of {module} failed: {e!r}")
+        if profiler:
+            profiler.mark("background warmup finished")
+
+    thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,132 @@
+import argparse
+import json
+import random
+import socket
+import time
+from types import SimpleNamespace
+
+UDP_IP = "127.0.0.1"
+UDP_PORT = 12345
+PACKET_POOL_SIZE = 1024 # distinct packets generated up front and cycled, so formatting never limits the send rate
+MALFORMED_KINDS = ("truncated", "garbage", "wrong_shape", "other_type")
+
+
+def band_power_packet(rows, digits=8):
+    # The exact datagram OpenBCI GUI sends: compact JSON, one [delta, theta, alpha, beta, gamma] row per channel
+    data = ",".join("[" + ",".join(f"{value:.{digits}g}" for value in row) + "]" for row in rows)
+    return ('{"type":"bandPower","data":[' + data + "]}").encode()
+
+
+def malformed_packet(kind, packet, rng):
+    if kind == "truncated":
+        return packet[:rng.randrange(1, len(packet))]
+    if kind == "garbage":
+        return bytes(rng.randrange(256) for _ in range(rng.randrange(1, 64)))
+    if kind == "wrong_shape":
+        return b'{"type":"bandPower","data":[[1.0,2.0,3.0]]}'
+    # Another OpenBCI GUI stream type on the same port; counted as non-bandPower rather than malformed
+    return b'{"type":"timeSeriesRaw","data":[[0.0,0.0,0.0,0.0]]}'
+
+
+def standalone_app():
+    # Stands in for FlowStateTestApp when a tool drives a UDPListener on its own; the listener only
+    # reads these for the detailed log
+    music_player = SimpleNamespace(current_genre=None, current_song=None)
+    return SimpleNamespace(current_cycle=1, correct_answers=0, music_player=music_player)
+
+
+def wait_until(due_ns):
+    # Sleep most of the way and spin the rest; sleep alone overshoots by about a millisecond
+    wait_ns = due_ns - time.perf_counter_ns()
+    if wait_ns > 1_000_000:
+        time.sleep((wait_ns - 1_000_000) / 1e9)
+    while time.perf_counter_ns() < due_ns:
+        pass
+
+
+class StreamSimulator:
+    # Sends synthetic bandPower packets at a fixed average rate. Packets go out in bursts of `burst`
+    # back to back, each burst scheduled on an absolute clock (so sleep overshoot doesn't lower the
+    # rate) and shifted by up to +-jitter_ms. A malformed fraction of packets is replaced by one of
+    # MALFORMED_KINDS. Band powers drift slowly per channel, like a resting EEG, so downstream
+    # ratios and flow scores see plausible values.
+    def __init__(self, host=UDP_IP, port=UDP_PORT, channels=8, rate=250.0, burst=1, jitter_ms=0.0, malformed=0.0,
+                 seed=None, digits=8):
+        self.address = (host, port)
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.jitter_ns = int(jitter_ms * 1e6)
+        self.malformed = malformed
+        self.rng = random.Random(seed)
+        self.packets = self.make_packets(channels, digits)
+        self.counts = {"sent": 0, "band_power": 0, **{kind: 0 for kind in MALFORMED_KINDS}, "send_errors": 0}
+
+    def make_packets(self, channels, digits):
+        levels = [[self.rng.uniform(2, 20) for _ in range(5)] for _ in range(channels)]
+        packets = []
+        for _ in range(PACKET_POOL_SIZE):
+            for row in levels:
+                for band, value in enumerate(row):
+                    row[band] = max(0.05, value * self.rng.lognormvariate(0, 0.05))
+            packets.append(band_power_packet(levels, digits))
+        return packets
+
+    def next_packet(self, index):
+        packet = self.packets[index % len(self.packets)]
+        if self.malformed and self.rng.random() < self.malformed:
+            kind = self.rng.choice(MALFORMED_KINDS)
+            self.counts[kind] += 1
+            return malformed_packet(kind, packet, self.rng)
+        self.counts["band_power"] += 1
+        return packet
+
+    def run(self, duration_seconds):
+        # Returns the counts sent by kind, plus the wall time spent sending
+        burst_period_ns = int(self.burst / self.rate * 1e9)
+        start_ns = time.perf_counter_ns()
+        index = 0
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for burst_number in range(int(duration_seconds * self.rate / self.burst)):
+                due_ns = start_ns + burst_number * burst_period_ns
+                if self.jitter_ns:
+                    due_ns += self.rng.randint(-self.jitter_ns, self.jitter_ns)
+                wait_until(due_ns)
+                for _ in range(self.burst):
+                    try:
+                        sock.sendto(self.next_packet(index), self.address)
+                    except OSError:
+                        self.counts["send_errors"] += 1
+                    index += 1
+                    self.counts["sent"] += 1
+        self.counts["elapsed_seconds"] = (time.perf_counter_ns() - start_ns) / 1e9
+        return self.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic OpenBCI bandPower packets over UDP")
+    parser.add_argument("--host", default=UDP_IP)
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=250, help="average packets per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send for")
+    parser.add_argument("--burst", type=int, default=1, help="packets sent back to back per burst (same average rate)")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random shift of every burst, +- this many ms")
+    parser.add_argument("--malformed", type=float, default=0, help="fraction of packets replaced by malformed ones")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="print the counts as JSON (used by bench_ingest.py)")
+    args = parser.parse_args()
+
+    simulator = StreamSimulator(args.host, args.port, args.channels, args.rate, args.burst, args.jitter_ms,
+                                args.malformed, args.seed)
+    counts = simulator.run(args.duration)
+    if args.json:
+        print(json.dumps(counts))
+    else:
+        print(f"Sent {counts['sent']} packets in {counts['elapsed_seconds']:.2f} s "
+              f"({counts['sent'] / counts['elapsed_seconds']:.0f} packets/s): " +
+              ", ".join(f"{counts[kind]} {kind}" for kind in ("band_power",) + MALFORMED_KINDS) +
+              f", {counts['send_errors']} send errors")
+
+
+if __name__ == "__main__":
+    main()